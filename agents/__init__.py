@@ -1,8 +1,10 @@
 """
 Agent 模块 - 意图路由与规划
+
+导出按需加载（PEP 562）：单例构造时会拉起 langchain_openai 并生成结构化输出 schema，
+只 import 子模块（如 agents.rewrite）时不必连带初始化 router / trip_planner
 """
-from agents.router import router, IntentRouter
-from agents.planner import trip_planner, TripPlanner
+from utils.lazy import lazy_getattr
 
 __all__ = [
     "router",
@@ -10,3 +12,10 @@ __all__ = [
     "trip_planner",
     "TripPlanner",
 ]
+
+__getattr__ = lazy_getattr(__name__, {
+    "router": "agents.router",
+    "IntentRouter": "agents.router",
+    "trip_planner": "agents.planner",
+    "TripPlanner": "agents.planner",
+})
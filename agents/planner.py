@@ -5,6 +5,7 @@
 给定用户需求（去哪里、玩几天、偏好、预算）+ 已有信息（天气、用户画像），让大模型生成一个可用的、多天多城市行程，并把结果转换成你系统内部统一使用的格式
 """
 from pydantic import BaseModel, Field,ConfigDict
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from utils.llm import get_structured_llm
 from graph.state import TripPlan, TripDay, WeatherInfo
@@ -12,7 +13,7 @@ from graph.state import TripPlan, TripDay, WeatherInfo
 #  规定“模型必须按什么格式回答”
 
 class PlannerActivity(BaseModel):
-    model_config = ConfigDict(extra="forbid")            #开启「严格模式」，禁止出现任何未定义的字段
+    model_config = ConfigDict(extra="forbid", frozen=True)            #开启「严格模式」，禁止出现任何未定义的字段；只读
     time: str = Field(description="如 09:00")
     name: str = Field(description="活动/景点名")
     description: str = Field(description="简介")
@@ -20,22 +21,23 @@ class PlannerActivity(BaseModel):
     cost: str = Field(description="如 50元/免费")
 
 class PlannerDay(BaseModel):
-    model_config = ConfigDict(extra="forbid")
+    model_config = ConfigDict(extra="forbid", frozen=True)
     date: str = Field(description="日期，允许相对描述或 YYYY-MM-DD")
     city: str = Field(description="城市")
     activities: list[PlannerActivity] = Field(description="当天活动列表",min_length = 1)
 
 class PlannerOutput(BaseModel):
     """规划器输出格式"""
-    model_config = ConfigDict(extra="forbid")
+    model_config = ConfigDict(extra="forbid", frozen=True)
     title: str = Field(description="行程标题")
     days: list[PlannerDay] = Field(description="每日行程")
     total_budget_estimate: str = Field(description="总预算估计")
     tips: list[str] = Field(description="旅行小贴士")
 
 
-PLANNER_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是专业的旅行规划师，擅长设计个性化行程。
+# 系统提示拆成「基础骨架 + 按需追加的规则块」：
+# 没给预算 / 不是修改请求时不发送对应规则，减少 prompt token；基础骨架逐字节稳定，便于前缀缓存命中
+_PLANNER_BASE = """你是专业的旅行规划师，擅长设计个性化行程。
 
 ## 规划原则
 1. **节奏合理**：每天 3-4 个主要活动，避免过于紧凑
@@ -44,7 +46,26 @@ PLANNER_PROMPT = ChatPromptTemplate.from_messages([
 4. **天气适配**：雨天推荐室内活动，晴天安排户外
 5. **本地特色**：融入当地美食和文化体验
 
-## 预算使用规则（非常重要！！！）
+### 每个活动必须标注费用：
+- 门票费用（如：西湖免费、灵隐寺75元）
+- 餐饮费用（如：人均80元、约150元）
+- 体验费用（如：游船50元、演出180元）
+- 交通费用（如：打车约30元）
+
+## 输出格式
+每日行程包含:
+- date: 日期
+- city: 城市
+- activities: [
+    {"time": "09:00", "name": "景点名", "description": "简介", "duration": "2小时", "cost": "门票50元"}
+  ]
+
+**total_budget_estimate 必须是所有活动费用的合计，格式如："约850元（门票200+餐饮400+交通100+体验150）"**
+
+请根据用户需求生成详细行程。"""
+
+# 仅当用户给了预算时追加
+_BUDGET_ADDENDUM = """## 预算使用规则（非常重要！！！）
 用户预算是他们**愿意花费的金额**，你的方案应该**充分利用预算**，而不是尽量省钱！
 
 ### 预算匹配原则：
@@ -71,33 +92,19 @@ PLANNER_PROMPT = ChatPromptTemplate.from_messages([
   - 免费或低价景点为主
   - 公共交通
 
-### 每个活动必须标注费用：
-- 门票费用（如：西湖免费、灵隐寺75元）
-- 餐饮费用（如：人均80元、约150元）
-- 体验费用（如：游船50元、演出180元）
-- 交通费用（如：打车约30元）
+确保总花费接近用户预算！"""
 
-## 修改行程规则（非常重要！）
+# 仅当存在之前的行程（修改请求）时追加
+_MODIFY_ADDENDUM = """## 修改行程规则（非常重要！）
 如果用户提供了"之前的行程"并要求修改：
 - **必须仔细阅读用户的修改请求**
 - 如果用户说"XX去过了"、"不想去XX"、"换掉XX"，**必须完全移除**该景点，用其他景点替代
 - 即使用户只说了部分名称（如"大别山"），也要排除包含该关键词的所有景点（如"黄冈大别山"）
 - 如果用户调整预算（更高/更低），**必须相应调整推荐的档次和总花费**
 - 推荐同城市、同类型的替代景点
-- 保持行程的其他部分不变（除非用户要求全部重新规划）
-
-## 输出格式
-每日行程包含:
-- date: 日期
-- city: 城市
-- activities: [
-    {{"time": "09:00", "name": "景点名", "description": "简介", "duration": "2小时", "cost": "门票50元"}}
-  ]
-
-**total_budget_estimate 必须是所有活动费用的合计，格式如："约850元（门票200+餐饮400+交通100+体验150）"**
+- 保持行程的其他部分不变（除非用户要求全部重新规划）"""
 
-请根据用户需求生成详细行程，确保总花费接近用户预算！"""),
-    ("human", """## 用户当前请求（最重要！必须响应这个请求！）
+_PLANNER_HUMAN = """## 用户当前请求（最重要！必须响应这个请求！）
 {user_input}
 
 ## ⚠️ 调整指令（如果有，必须严格执行！）
@@ -124,15 +131,34 @@ PLANNER_PROMPT = ChatPromptTemplate.from_messages([
 ## 之前的行程（仅供参考，如果有调整指令，必须生成不同的行程！）
 {previous_plan}
 
-请根据用户请求生成行程规划，**确保总花费接近用户预算 {budget}**！""")
-])
+请根据用户请求生成行程规划，**确保总花费接近用户预算 {budget}**！"""
+
+
+def _build_planner_prompt(has_budget: bool, has_previous: bool) -> ChatPromptTemplate:
+    """基础骨架 + 按需规则块；系统消息是固定文本，不参与模板渲染"""
+    messages = [SystemMessage(content=_PLANNER_BASE)]
+    if has_budget:
+        messages.append(SystemMessage(content=_BUDGET_ADDENDUM))
+    if has_previous:
+        messages.append(SystemMessage(content=_MODIFY_ADDENDUM))
+    messages.append(("human", _PLANNER_HUMAN))
+    return ChatPromptTemplate.from_messages(messages)
 
 
 class TripPlanner:
     """行程规划器"""
 
     def __init__(self):
-        self.chain = PLANNER_PROMPT | get_structured_llm(PlannerOutput, temperature=0.3)
+        self.llm = get_structured_llm(PlannerOutput, temperature=0.3)
+        # (has_budget, has_previous) -> chain，最多 4 种组合，按需构建后复用
+        self._chains: dict[tuple[bool, bool], object] = {}
+
+    def _get_chain(self, has_budget: bool, has_previous: bool):
+        key = (has_budget, has_previous)
+        chain = self._chains.get(key)
+        if chain is None:
+            chain = self._chains[key] = _build_planner_prompt(has_budget, has_previous) | self.llm
+        return chain
 
     def plan(self, context: dict) -> TripPlan:
         """生成行程规划"""
@@ -140,28 +166,22 @@ class TripPlanner:
         weather_data = context.get("weather_data", {})
         user_profile = context.get("user_profile", {})
 
-        # 格式化天气信息（兼容：dict / WeatherInfo / list[dict|WeatherInfo]）
-        weather_info = ""
-        for city, weather in (weather_data or {}).items():
-            if weather is None:
-                weather_info += f"- {city}: 暂无天气数据\n"
-                continue
-
-            # 多日预报
-            if isinstance(weather, list):
-                weather_info += f"- {city}（多日预报）:\n"
-                for i, w in enumerate(weather, start=1):
-                    if isinstance(w, dict):
-                        weather_info += f"  - D{i}: {w.get('weather', '未知')} {w.get('temperature', '?')}°C\n"
-                    else:
-                        weather_info += f"  - D{i}: {w.weather} {w.temperature}°C\n"
-                continue
-
-            # 单日
-            if isinstance(weather, dict):
-                weather_info += f"- {city}: {weather.get('weather', '未知')} {weather.get('temperature', '?')}°C\n"
+        # 天气统一规整为 {city: list[WeatherInfo]}（兼容：dict / WeatherInfo / list[dict|WeatherInfo]）
+        weather_by_city = {city: _coerce_weather(w) for city, w in (weather_data or {}).items()}
+
+        # 格式化天气信息：先收集到列表再一次性 join，避免字符串反复 += 拼接
+        weather_parts: list[str] = []
+        for city, ws in weather_by_city.items():
+            if not ws:
+                weather_parts.append(f"- {city}: 暂无天气数据\n")
+            elif len(ws) > 1:
+                # 多日预报
+                weather_parts.append(f"- {city}（多日预报）:\n")
+                for i, w in enumerate(ws, start=1):
+                    weather_parts.append(f"  - D{i}: {w.weather} {w.temperature}°C\n")
             else:
-                weather_info += f"- {city}: {weather.weather} {weather.temperature}°C\n"
+                weather_parts.append(f"- {city}: {ws[0].weather} {ws[0].temperature}°C\n")
+        weather_info = "".join(weather_parts)
 
         # 格式化用户画像
         profile_str = ""
@@ -172,7 +192,8 @@ class TripPlanner:
         # 格式化之前的行程（用于修改请求）
         previous_plan = context.get("previous_plan")
         previous_plan_str = "无（这是新的行程规划请求）"
-        if previous_plan and getattr(previous_plan, "days", None):
+        has_previous = bool(previous_plan and getattr(previous_plan, "days", None))
+        if has_previous:
             lines = [f"标题: {previous_plan.title}"]
             for i, day in enumerate(previous_plan.days, 1):
                 day_activities = []
@@ -183,21 +204,22 @@ class TripPlanner:
                 lines.append(f"Day {i} ({day.city}): {', '.join(day_activities) or '无活动'}")
             previous_plan_str = "\n".join(lines)
 
-        # 格式化排除和包含的景点
-        excluded_places = context.get("excluded_places") or []
+        # 格式化排除和包含的景点（排序：相同集合渲染出相同 prompt，提高前缀缓存命中率）
+        excluded_places = sorted(context.get("excluded_places") or [])
         excluded_str = ", ".join(excluded_places) if excluded_places else "无"
 
-        included_places = context.get("included_places") or []
+        included_places = sorted(context.get("included_places") or [])
         included_str = ", ".join(included_places) if included_places else "无"
 
         # 调用 LLM
         adjustment_hint = context.get("adjustment_hint") or "无特殊调整要求"
-        result = self.chain.invoke({
+        chain = self._get_chain(bool(entities.get("budget")), has_previous)
+        result = chain.invoke({
             "user_input": context.get("user_input", ""),
             "adjustment_hint": adjustment_hint,
             "cities": ", ".join(entities.get("cities", ["未指定"])),
             "dates": ", ".join(entities.get("dates", [])) or f"{entities.get('duration_days', 2)}天",
-            "preferences": ", ".join(entities.get("preferences", ["无特别偏好"])),
+            "preferences": ", ".join(sorted(entities.get("preferences") or ["无特别偏好"])),
             "budget": entities.get("budget") or "未指定",
             "excluded_places": excluded_str,
             "included_places": included_str,
@@ -206,46 +228,29 @@ class TripPlanner:
             "previous_plan": previous_plan_str
         })
 
-        # 转换为 TripPlan
+        # 转换为 TripPlan（整体 dump 一次，后续按普通 dict 处理）
+        result_dump = result.model_dump()
         days = []
-        for idx, day_data in enumerate(result.days):
-            city = getattr(day_data, "city", "")
-            date = getattr(day_data, "date", "")
-
-            weather = None
-            if city in (weather_data or {}):
-                w = weather_data[city]
-
-                # ✅ 多日：按 idx 取对应天，超出则取最后一天兜底
-                if isinstance(w, list) and w:
-                    pick = w[min(idx, len(w) - 1)]
-                    if isinstance(pick, dict):
-                        weather = WeatherInfo(**pick)
-                    else:
-                        weather = pick
-
-                # 单日：dict / WeatherInfo
-                elif isinstance(w, dict):
-                    weather = WeatherInfo(**w)
-                else:
-                    weather = w  # WeatherInfo 或 None
-
-            activities = []
-            for a in getattr(day_data, "activities", []) or []:
-                activities.append(a.model_dump() if hasattr(a, "model_dump") else a.dict())
+        for idx, day_data in enumerate(result_dump["days"]):
+            city = day_data["city"]
+            date = day_data["date"]
+
+            # 多日：按 idx 取对应天，超出则取最后一天兜底
+            ws = weather_by_city.get(city)
+            weather = ws[min(idx, len(ws) - 1)] if ws else None
 
             days.append(TripDay(
                 date=date,
                 city=city,
-                activities=activities,
+                activities=day_data["activities"],
                 weather=weather
             ))
 
         return TripPlan(
-            title=result.title,
+            title=result_dump["title"],
             days=days,
-            total_budget_estimate=result.total_budget_estimate,
-            tips=result.tips
+            total_budget_estimate=result_dump["total_budget_estimate"],
+            tips=result_dump["tips"]
         )
 
     def generate_backup(self, day: TripDay) -> str:
@@ -262,6 +267,14 @@ class TripPlanner:
         return response.content
 
 
+def _coerce_weather(w) -> list[WeatherInfo]:
+    """单日/多日、dict/WeatherInfo 统一成 list[WeatherInfo]；None 或空列表返回 []"""
+    if w is None:
+        return []
+    items = w if isinstance(w, list) else [w]
+    return [x if isinstance(x, WeatherInfo) else WeatherInfo(**x) for x in items if x is not None]
+
+
 # 单例
 trip_planner = TripPlanner()
 
@@ -3,15 +3,16 @@ Rewrite 节点：把用户输入规范化成更可执行的查询，并抽取关
 不做时间解析：例如“这周末”原样保留在 dates_text
 """
 from __future__ import annotations
-from datetime import date
 from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, Field,ConfigDict
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
+from utils.dates import today_str
 from utils.llm import get_structured_llm
 
 class RewriteSlots(BaseModel):
     # 关键：禁止额外字段 -> JSON Schema additionalProperties=false
-    model_config = ConfigDict(extra="forbid")
+    model_config = ConfigDict(extra="forbid", frozen=True)
 
     cities: List[str] = Field(default_factory=list, description="提到的城市/目的地列表")
     duration_days: Optional[int] = Field(default=None, description="行程天数；缺失则为 null（默认策略在下游处理）")
@@ -20,7 +21,7 @@ class RewriteSlots(BaseModel):
     dates_text: Optional[str] = Field(default=None, description="日期原话，如 这周末/下周/国庆（不做时间解析）")
 
 class RewriteResult(BaseModel):
-    model_config = ConfigDict(extra="forbid")
+    model_config = ConfigDict(extra="forbid", frozen=True)
 
     rewritten_query: str = Field(..., description="不改变含义的清晰改写，用于后续路由/检索/规划")
     slots: RewriteSlots = Field(default_factory=RewriteSlots, description="抽取的关键槽位（固定字段）")
@@ -32,9 +33,9 @@ class RewriteResult(BaseModel):
 
 REWRITE_PROMPT = ChatPromptTemplate.from_messages(
     [
-        (
-            "system",
-            "你是一个对话请求规范化（rewrite）与缺口识别助手。\n"
+        # 固定文本用 SystemMessage，不参与模板渲染
+        SystemMessage(
+            content="你是一个对话请求规范化（rewrite）与缺口识别助手。\n"
             "目标：不改变用户意图，把用户话改写为更清晰、可执行的请求，并抽取关键槽位。\n"
             "重要约束：\n"
             "1) 不要做时间解析：例如不要把“这周末”转换为具体日期；原样保留即可。\n"
@@ -45,11 +46,12 @@ REWRITE_PROMPT = ChatPromptTemplate.from_messages(
              "若 duration_days 为空：优先追问“玩几天（给 1/2/3 天选项）。\n"
              "若 dates_text 为空：次优先追问“什么时候去（如这周末/下周/某日期）。\n"
              " 预算 budget_text 可选：仅在上述两项都不缺时再追问，或用户明显在意价格时追问\n"
-             " 澄清问题数量上限：最多 2 个，能合并就合并。\n"
-              "当前日期：{current_date}\n",
+             " 澄清问题数量上限：最多 2 个，能合并就合并。\n",
         ),
         (
+            # 日期放在 human 消息：system 前缀跨轮不变，便于服务端前缀缓存命中
             "human",
+            "当前日期：{current_date}\n"
             "用户输入：{user_input}\n\n"
             "请输出结构化结果。slots 建议包含：\n"
             "- cities: list[str]\n"
@@ -65,12 +67,18 @@ REWRITE_PROMPT = ChatPromptTemplate.from_messages(
 class Rewriter:
     def __init__(self):
         self.llm = get_structured_llm(RewriteResult, temperature=0.0)
+        self.chain = REWRITE_PROMPT | self.llm
 
     def rewrite(self, user_input: str, current_date: Optional[str] = None) -> RewriteResult:
         if not current_date:
-            current_date = str(date.today())
-        chain = REWRITE_PROMPT | self.llm
-        return chain.invoke({"user_input": user_input, "current_date": current_date})
+            current_date = today_str()
+        return self.chain.invoke({"user_input": user_input, "current_date": current_date})
+
+    async def rewrite_async(self, user_input: str, current_date: Optional[str] = None) -> RewriteResult:
+        """rewrite 的异步版本（可与 router 并发）"""
+        if not current_date:
+            current_date = today_str()
+        return await self.chain.ainvoke({"user_input": user_input, "current_date": current_date})
 
 
 rewriter = Rewriter()
@@ -2,14 +2,19 @@
 意图识别 + 实体抽取 Router
 这是 IntelliGo 的"前台接待"
 """
-from pydantic import BaseModel, Field
+import re
+from pydantic import BaseModel, Field, ConfigDict
+from langchain_core.messages import SystemMessage
 from langchain_core.prompts import ChatPromptTemplate
 from utils.llm import get_structured_llm
 from graph.state import UserIntent
+from tools.weather import CITY_CODES
 
 
 class IntentExtractionResult(BaseModel):
-    """LLM 结构化输出格式"""
+    """LLM 结构化输出格式（只读：解析后立即展开为 UserIntent）"""
+    model_config = ConfigDict(extra="forbid", frozen=True)
+
     intent_type: str = Field(
         description="意图类型: clothing_advice(穿搭建议) / trip_planning(行程规划) / general_qa(旅行相关问答) / general_chat(闲聊) / unknown(无法识别)"
     )
@@ -31,8 +36,9 @@ class IntentExtractionResult(BaseModel):
     reasoning: str = Field(description="推理过程简述")
 
 
+# system 是固定文本（SystemMessage 不参与模板渲染），每轮只格式化很短的 human 消息
 ROUTER_PROMPT = ChatPromptTemplate.from_messages([
-    ("system", """你是 IntelliGo 的意图识别专家。分析用户输入，识别意图并抽取关键实体。
+    SystemMessage(content="""你是 IntelliGo 的意图识别专家。分析用户输入，识别意图并抽取关键实体。
 
 ## 意图类型定义（按优先级排序）
 1. **clothing_advice**: 用户询问穿什么、天气穿搭、出门穿衣建议、要带什么衣物/是否需要外套/冷不冷热不热
@@ -73,9 +79,6 @@ ROUTER_PROMPT = ChatPromptTemplate.from_messages([
 - **query_subject**：仅当 intent_type=general_qa 时提取，记录用户询问的主题（如"餐厅推荐"、"电影院"、"西湖"）
 - **has_health_concern**：仅当 intent_type=general_qa 且涉及健康/疾病/身体状况时为 true
 
-## 当前日期
-{current_date}
-
 ## 示例（用于校准）
 - 输入：我想去杭州玩3天，我应该带什么衣服？
   输出：intent_type=clothing_advice，cities=["杭州"], duration_days=3
@@ -107,10 +110,73 @@ ROUTER_PROMPT = ChatPromptTemplate.from_messages([
   输出：intent_type=general_qa，query_subject="KTV推荐"
 
 请仔细分析，给出结构化结果。"""),
-    ("human", "{user_input}")
+    # 动态内容（含日期）只放在 human 消息里，system 前缀逐字节稳定，便于服务端前缀缓存命中
+    ("human", "## 当前日期\n{current_date}\n\n## 用户输入\n{user_input}")
 ])
 
 
+# ===== 快速通道：明显的意图直接用正则判定，不调用 LLM =====
+# 问候/道谢类闲聊：整句匹配，避免"你好，帮我规划杭州两天"被误判
+_CHAT_RX = re.compile(
+    r"\s*(你好|您好|嗨|哈喽|hi|hello|hey|在吗|在不在|谢谢|多谢|谢啦|拜拜|再见)"
+    r"[呀啊哈吗呢哦噢~～!！,，.。?？\s]*",
+    re.IGNORECASE,
+)
+# 穿搭类：问句核心是衣物（与 prompt 中"穿搭优先"的规则一致）
+_CLOTHING_RX = re.compile(r"穿什么|怎么穿|穿搭|带什么衣|带.{0,4}外套|要不要.{0,2}外套|冷不冷|热不热")
+# 涉及行程安排/修改、问答、健康等复合诉求时交给 LLM 判断
+_CLOTHING_VETO_RX = re.compile(r"行程|规划|安排|路线|攻略|去过|不想去|换|推荐|介绍|血压|糖尿|膝盖|孕")
+
+_FAST_RULES: list[tuple[re.Pattern, str]] = [
+    (_CHAT_RX, "general_chat"),
+    (_CLOTHING_RX, "clothing_advice"),
+]
+
+_CITY_RX = re.compile("|".join(sorted(map(re.escape, CITY_CODES), key=len, reverse=True)))
+_DATE_RX = re.compile(r"今天|明天|后天|大后天|这周末|下周末|周末|(?:这|下)?(?:周|星期)[一二三四五六日天]")
+_DAYS_RX = re.compile(r"([1-9]|[一两二三四五六七])\s*天")
+_CN_NUM = {"一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7}
+
+
+def _fast_path(user_input: str) -> UserIntent | None:
+    """命中快速规则时直接构造 UserIntent；未命中返回 None（走 LLM）"""
+    text = (user_input or "").strip()
+    if not text:
+        return None
+
+    for rx, intent_type in _FAST_RULES:
+        if intent_type == "general_chat":
+            if not rx.fullmatch(text):
+                continue
+        elif not rx.search(text) or _CLOTHING_VETO_RX.search(text):
+            continue
+
+        cities = list(dict.fromkeys(_CITY_RX.findall(text)))
+        m = _DAYS_RX.search(text)
+        duration_days = None
+        if m:
+            n = m.group(1)
+            duration_days = int(n) if n.isdigit() else _CN_NUM[n]
+
+        return UserIntent(
+            intent_type=intent_type,
+            confidence=0.95,
+            extracted_entities={
+                "cities": cities,
+                "dates": list(dict.fromkeys(_DATE_RX.findall(text))),
+                "duration_days": duration_days,
+                "preferences": [],
+                "budget": None,
+                "excluded_places": [],
+                "included_places": [],
+                "query_subject": None,
+                "has_health_concern": False,
+                "reasoning": "fast_path",
+            },
+        )
+    return None
+
+
 class IntentRouter:
     """意图路由器"""
 
@@ -119,11 +185,33 @@ class IntentRouter:
 
     def analyze(self, user_input: str, current_date: str) -> UserIntent:
         """分析用户输入，返回意图和实体"""
+        fast = _fast_path(user_input)
+        if fast is not None:
+            return fast
         result: IntentExtractionResult = self.chain.invoke({
             "user_input": user_input,
             "current_date": current_date
         })
+        return self._to_intent(result)
+
+    async def analyze_async(self, user_input: str, current_date: str) -> UserIntent:
+        """analyze 的异步版本（可与 rewrite 并发）"""
+        fast = _fast_path(user_input)
+        if fast is not None:
+            return fast
+        result: IntentExtractionResult = await self.chain.ainvoke({
+            "user_input": user_input,
+            "current_date": current_date
+        })
+        return self._to_intent(result)
+
+    @staticmethod
+    def fast_path(user_input: str) -> UserIntent | None:
+        """只跑快速规则（不调用 LLM）"""
+        return _fast_path(user_input)
 
+    @staticmethod
+    def _to_intent(result: IntentExtractionResult) -> UserIntent:
         return UserIntent(
             intent_type=result.intent_type,
             confidence=result.confidence,
@@ -9,6 +9,9 @@ load_dotenv()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
+# 配置信息只打印一次（多次实例化 Config 时不重复刷屏）
+_printed = False
+
 @dataclass
 class Config:
     """全局配置"""
@@ -24,9 +27,15 @@ class Config:
     chroma_persist_dir: str = field(default_factory=lambda: os.path.join(BASE_DIR, "data", "chroma_db"))
     chroma_collection_name: str = "user_preferences"
 
+    # 会话存储：设置后用 Redis 共享会话（多 worker 部署必需），否则存在进程内存
+    redis_url: str = field(default_factory=lambda: os.getenv("REDIS_URL", ""))
+
     # 管理指令口令
     purge_token: str = field(default_factory=lambda: os.getenv("PURGE_TOKEN", ""))
 
+    # 语义缓存：近似重复输入复用 rewrite/意图识别结果（需加载本地 embedding 模型，默认关闭）
+    semantic_cache: bool = field(default_factory=lambda: os.getenv("SEMANTIC_CACHE", "false").lower() == "true")
+
     # 系统设置
     debug: bool = field(default_factory=lambda: os.getenv("DEBUG", "true").lower() == "true")
 
@@ -41,7 +50,9 @@ class Config:
 
     def __post_init__(self):
         """初始化后打印配置（调试用）"""
-        if self.debug:
+        global _printed
+        if self.debug and not _printed:
+            _printed = True
             print(f"🔧 Config loaded:")
             print(f"   - API Base: {self.openai_base_url}")
             print(f"   - Model: {self.openai_model}")
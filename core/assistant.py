@@ -1,10 +1,10 @@
 from __future__ import annotations
 
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
 
 from config import config
-from graph.builder import get_compiled_graph
-from graph.state import GraphState
+from graph.state import build_initial_state
+from utils.aio import run_sync
 
 # 懒加载/单例：避免每次请求都 compile
 _GRAPH = None
@@ -13,6 +13,8 @@ _GRAPH = None
 def get_graph():
     global _GRAPH
     if _GRAPH is None:
+        # 延迟导入：graph.builder 会连带加载全部 agent/LLM/向量库模块
+        from graph.builder import get_compiled_graph
         _GRAPH = get_compiled_graph()
     return _GRAPH
 
@@ -43,74 +45,60 @@ def validate_config_or_raise() -> None:
         raise RuntimeError("Config invalid: " + "; ".join(fatal))
 
 
-def _carry_from_last_state(last_state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    """
-    复刻你 main.py 的跨轮继承字段逻辑：
-    messages/entities/user_profile/weather_data/trip_plan/excluded/included
-    """
-    carry: Dict[str, Any] = {}
-    if not last_state:
-        return carry
-
-    for k in [
-        "messages",
-        "entities",
-        "user_profile",
-        "weather_data",
-        "trip_plan",
-        "excluded_places",
-        "included_places",
-    ]:
-        v = last_state.get(k)
-        if v is not None:
-            carry[k] = v
-
-    return carry
-
-
-def _reset_fields() -> Dict[str, Any]:
-    """复刻你 main.py 每轮重置字段。"""
-    return dict(
-        rewritten_query="",
-        rewrite_slots={},
-        need_clarification=False,
-        clarifying_questions=[],
-        clarify_only=False,
-        intent=None,
-        clothing_advice="",
-        final_response="",
-        current_node="",
-        needs_replan=False,
-        error_message="",
-    )
-
-
-def run_one_turn(
+async def arun_one_turn(
     user_input: str,
     last_state: Optional[Dict[str, Any]] = None,
 ) -> Tuple[Dict[str, Any], str]:
     """
-    单轮对话：
+    单轮对话（异步，供 async 接口直接 await，在调用方的事件循环上执行）：
     - 输入：user_input + 上一轮 last_state(dict)
     - 输出：final_state(dict) + final_response(str)
     """
     graph = get_graph()
 
-    carry = _carry_from_last_state(last_state)
-    reset = _reset_fields()
-
-    initial_state = GraphState(**carry, **reset, user_input=user_input)
-
-    final_state = None
-    for event in graph.stream(initial_state, stream_mode="values"):
-        final_state = event
+    initial_state = build_initial_state(user_input, last_state)
 
-        # 如果你想在 API 日志里看到节点流转，可打开下面这段（谨慎：日志会很多）
-        # if config.debug and event.get("current_node"):
-        #     print(f"[debug] node -> {event['current_node']}")
+    # 只需最终 state：ainvoke 一次返回，不像 stream_mode="values" 那样每个节点都产出一份完整 state
+    final_state = await graph.ainvoke(initial_state)
 
     if not final_state:
         return {}, "抱歉，处理过程中出现问题（empty final_state）"
 
     response = final_state.get("final_response") or "抱歉，处理过程中出现问题（empty final_response）"
     return final_state, response
+
+
+async def astream_one_turn(
+    user_input: str,
+    last_state: Optional[Dict[str, Any]] = None,
+) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    单轮对话（流式）：边执行边产出
+    - ("partial", chunk)：节点通过 stream writer 推送的增量（general_qa 的 token、穿搭的逐日块等）
+    - ("final", {"state": final_state, "reply": final_response})：最后一条，内容同 arun_one_turn 的返回
+    """
+    graph = get_graph()
+
+    initial_state = build_initial_state(user_input, last_state)
+
+    final_state: Dict[str, Any] = {}
+    async for mode, chunk in graph.astream(initial_state, stream_mode=["custom", "values"]):
+        if mode == "custom":
+            yield "partial", chunk
+        else:
+            final_state = chunk
+
+    if not final_state:
+        yield "final", {"state": {}, "reply": "抱歉，处理过程中出现问题（empty final_state）"}
+        return
+
+    response = final_state.get("final_response") or "抱歉，处理过程中出现问题（empty final_response）"
+    yield "final", {"state": final_state, "reply": response}
+
+
+def run_one_turn(
+    user_input: str,
+    last_state: Optional[Dict[str, Any]] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """arun_one_turn 的同步版本：图内含 async 节点（并发 LLM 调用），在常驻事件循环上驱动"""
+    return run_sync(arun_one_turn(user_input, last_state))
@@ -1,7 +1,43 @@
 from __future__ import annotations
+import threading
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+from pydantic import BaseModel, TypeAdapter
+
+from graph.state import GraphState
+
+# GraphState 是 TypedDict，用 TypeAdapter 校验并还原嵌套的 pydantic 对象（模块加载时构建一次）
+_STATE_ADAPTER = TypeAdapter(GraphState)
+
+
+# ===== state 序列化（供需要跨进程持久化的存储使用，如 Redis）=====
+def _orjson_default(obj: Any) -> Any:
+    """orjson 不认识的对象：pydantic 模型按 JSON 模式导出（由 pydantic-core 完成，不经 json 模块）"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def encode_state(state: Dict[str, Any]) -> bytes:
+    """GraphState 输出 dict -> JSON bytes（messages 按 LangChain 标准格式保存类型信息）"""
+    data = dict(state)
+    messages = data.get("messages")
+    if messages:
+        data["messages"] = messages_to_dict([m for m in messages if isinstance(m, BaseMessage)])
+    return orjson.dumps(data, default=_orjson_default)
+
+
+def decode_state(raw: bytes | str) -> Dict[str, Any]:
+    """encode_state 的逆过程：还原 messages 及 intent/trip_plan/weather_data 等 pydantic 对象"""
+    data = orjson.loads(raw)
+    if data.get("messages"):
+        data["messages"] = messages_from_dict(data["messages"])
+    return _STATE_ADAPTER.validate_python(data)
 
 
 @dataclass
@@ -13,27 +49,111 @@ class SessionRecord:
 class InMemorySessionStore:
     """
     最简会话存储：适合单进程部署/个人使用
-    注意：进程重启会丢会话；多进程会话不共享（上线稳定版建议换 Redis）
+    注意：进程重启会丢会话；多进程会话不共享（多 worker 部署请设置 REDIS_URL 使用 RedisSessionStore）
+
+    按更新时间排序的有界 LRU：所有会话 TTL 相同，队头永远是最早过期的那条，
+    get/set 时从队头顺手清掉过期/超量记录，无需后台清理线程
     """
 
-    def __init__(self, ttl_seconds: int = 60 * 60 * 24):
-        self._db: Dict[str, SessionRecord] = {}
+    def __init__(
+        self,
+        ttl_seconds: int = 60 * 60 * 24,
+        max_size: int = 10_000,
+        on_reset: Optional[Callable[[], None]] = None,
+    ):
+        self._db: OrderedDict[str, SessionRecord] = OrderedDict()
         self._ttl = ttl_seconds
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        # reset 时的额外清理钩子（如清空 LLM 响应缓存）
+        self._on_reset = on_reset
+
+    def _evict(self, now: float) -> None:
+        """从队头淘汰过期记录，以及超出 max_size 的最久未更新记录（需持锁调用）"""
+        while self._db:
+            sid, rec = next(iter(self._db.items()))
+            if len(self._db) > self._max_size or now - rec.updated_at > self._ttl:
+                self._db.popitem(last=False)
+            else:
+                break
 
     def get(self, session_id: str) -> Optional[Dict[str, Any]]:
-        rec = self._db.get(session_id)
-        if not rec:
-            return None
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            rec = self._db.get(session_id)
+            if not rec:
+                return None
 
-        if time.time() - rec.updated_at > self._ttl:
-            # 过期清理
-            self._db.pop(session_id, None)
-            return None
+            if now - rec.updated_at > self._ttl:
+                # 过期清理
+                self._db.pop(session_id, None)
+                return None
 
-        return rec.state
+            return rec.state
+
+    async def aget(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.get(session_id)
 
     def set(self, session_id: str, state: Optional[Dict[str, Any]]) -> None:
-        self._db[session_id] = SessionRecord(state=state, updated_at=time.time())
+        now = time.time()
+        with self._lock:
+            self._db[session_id] = SessionRecord(state=state, updated_at=now)
+            self._db.move_to_end(session_id)
+            self._evict(now)
+
+    async def aset(self, session_id: str, state: Optional[Dict[str, Any]]) -> None:
+        self.set(session_id, state)
 
     def reset(self, session_id: str) -> None:
-        self._db.pop(session_id, None)
+        with self._lock:
+            self._db.pop(session_id, None)
+        if self._on_reset:
+            self._on_reset()
+
+    async def areset(self, session_id: str) -> None:
+        self.reset(session_id)
+
+
+class RedisSessionStore:
+    """
+    Redis 会话存储：多 worker / 多实例共享会话（设置 REDIS_URL 时启用）
+    state 经 encode_state 序列化为 JSON，过期交给 Redis 的 EX 处理
+    只提供异步接口（aget/aset/areset），与 InMemorySessionStore 的异步接口一致
+    """
+
+    KEY_PREFIX = "intelligo:session:"
+
+    def __init__(
+        self,
+        url: str,
+        ttl_seconds: int = 60 * 60 * 24,
+        on_reset: Optional[Callable[[], None]] = None,
+    ):
+        import redis.asyncio as redis
+
+        # 连接池由客户端内部维护，首次命令时才建立连接
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl_seconds
+        self._on_reset = on_reset
+
+    def _key(self, session_id: str) -> str:
+        return self.KEY_PREFIX + session_id
+
+    async def aget(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self._key(session_id))
+        return decode_state(raw) if raw else None
+
+    async def aset(self, session_id: str, state: Optional[Dict[str, Any]]) -> None:
+        if state is None:
+            await self._redis.delete(self._key(session_id))
+            return
+        await self._redis.set(self._key(session_id), encode_state(state), ex=self._ttl)
+
+    async def areset(self, session_id: str) -> None:
+        await self._redis.delete(self._key(session_id))
+        if self._on_reset:
+            self._on_reset()
+
+    async def aclose(self) -> None:
+        await self._redis.aclose()
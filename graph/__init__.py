@@ -1,8 +1,11 @@
 """
 LangGraph 核心 - 状态、节点、边、图构建
+
+图构建相关导出按需加载：只用 graph.state 时不必连带加载全部节点/agent
 """
-from graph.state import GraphState, UserIntent, WeatherInfo, TripPlan, TripDay
-from graph.builder import build_graph, get_compiled_graph
+from utils.lazy import lazy_getattr
+
+from graph.state import GraphState, UserIntent, WeatherInfo, TripPlan, TripDay, build_initial_state
 
 __all__ = [
     # 状态
@@ -11,7 +14,13 @@ __all__ = [
     "WeatherInfo",
     "TripPlan",
     "TripDay",
+    "build_initial_state",
     # 图
     "build_graph",
     "get_compiled_graph",
 ]
+
+__getattr__ = lazy_getattr(__name__, {
+    "build_graph": "graph.builder",
+    "get_compiled_graph": "graph.builder",
+})
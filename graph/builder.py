@@ -6,11 +6,9 @@ from langgraph.graph import StateGraph, END
 
 from graph.state import GraphState
 from graph.nodes import (
-    node_rewrite,
+    node_rewrite_and_route,
     node_clarify_gate,
-    node_intent_recognition,
-    node_load_memory,
-    node_fetch_weather,
+    node_load_context,
     node_clothing_advice,
     node_trip_planning,
     node_risk_assessment,
@@ -26,7 +24,8 @@ def build_graph() -> StateGraph:
     构建 IntelliGo 工作流图
 
     流程:
-    START -> intent_recognition -> load_memory -> fetch_weather
+    START -> rewrite_and_route(rewrite ∥ intent_recognition) -> clarify_gate
+          -> load_context(load_memory ∥ fetch_weather)
           -> [路由]
              ├─ clothing -> clothing_advice -> format_response
              ├─ planning -> trip_planning -> [风险检查]
@@ -40,11 +39,9 @@ def build_graph() -> StateGraph:
     workflow = StateGraph(GraphState)
 
     # 添加节点
-    workflow.add_node("rewrite", node_rewrite)
-    workflow.add_node("intent_recognition", node_intent_recognition)
+    workflow.add_node("rewrite_and_route", node_rewrite_and_route)
     workflow.add_node("clarify_gate", node_clarify_gate)
-    workflow.add_node("load_memory", node_load_memory)
-    workflow.add_node("fetch_weather", node_fetch_weather)
+    workflow.add_node("load_context", node_load_context)
     workflow.add_node("clothing_advice", node_clothing_advice)
     workflow.add_node("trip_planning", node_trip_planning)
     workflow.add_node("risk_assessment", node_risk_assessment)
@@ -53,11 +50,10 @@ def build_graph() -> StateGraph:
     workflow.add_node("update_memory", node_update_memory)
 
     # 设置入口
-    workflow.set_entry_point("rewrite")
+    workflow.set_entry_point("rewrite_and_route")
 
-    # 添加边
-    workflow.add_edge("rewrite", "intent_recognition")
-    workflow.add_edge("intent_recognition", "clarify_gate")
+    # 添加边（rewrite 与意图识别在同一节点内并发完成）
+    workflow.add_edge("rewrite_and_route", "clarify_gate")
 
     # 澄清门控：ask 直接格式化输出；continue 才继续后面的流程
     workflow.add_conditional_edges(
@@ -65,16 +61,13 @@ def build_graph() -> StateGraph:
         route_after_clarify,
         {
             "ask": "update_memory",
-            "continue": "load_memory",
+            "continue": "load_context",
         }
     )
 
-
-    workflow.add_edge("load_memory", "fetch_weather")
-
-    # 条件路由：根据意图分流
+    # 条件路由：根据意图分流（记忆与天气在 load_context 内并发加载完成后）
     workflow.add_conditional_edges(
-        "fetch_weather",
+        "load_context",
         route_by_intent,
         {
             "clothing": "clothing_advice",
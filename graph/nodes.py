@@ -2,21 +2,69 @@
 LangGraph 节点定义
 
 """
-from datetime import date
+import asyncio
+import hashlib
+import re
+import threading
+import uuid
+from typing import TYPE_CHECKING, Any, Callable
 from langchain_core.messages import AIMessage, HumanMessage
-from graph.state import GraphState, TripPlan, TripDay
-from agents.router import router
-from tools.weather import weather_tool
-from tools.clothing import clothing_advisor
-from memory.vector_store import UserMemory
-from memory.entity_extractor import entity_extractor
-from agents.rewrite import rewriter
+from graph.state import GraphState, TripPlan, TripDay, WeatherInfo
+from config import config
+from langchain_core.prompts import ChatPromptTemplate
+from langgraph.config import get_stream_writer
+from utils.dates import today_str
 
-# 初始化记忆系统
-user_memory = UserMemory()
+if TYPE_CHECKING:
+    from memory.vector_store import UserMemory
 
 
-from typing import Any
+# ===== 重依赖按需构建：首次用到时才 import/实例化（如纯问答轮次不会加载向量库/embedding）=====
+_LAZY: dict[str, Any] = {}
+_LAZY_LOCK = threading.Lock()
+
+
+def _lazy(name: str, factory: Callable[[], Any]) -> Any:
+    obj = _LAZY.get(name)
+    if obj is None:
+        with _LAZY_LOCK:
+            obj = _LAZY.get(name)
+            if obj is None:
+                obj = _LAZY[name] = factory()
+    return obj
+
+
+def get_user_memory() -> "UserMemory":
+    """记忆系统单例（首次调用时加载 Chroma + embedding）"""
+    def _make():
+        from memory.vector_store import UserMemory
+        return UserMemory()
+    return _lazy("user_memory", _make)
+
+
+def _router():
+    from agents.router import router
+    return router
+
+
+def _rewriter():
+    from agents.rewrite import rewriter
+    return rewriter
+
+
+def _weather_tool():
+    from tools.weather import weather_tool
+    return weather_tool
+
+
+def _clothing_advisor():
+    from tools.clothing import clothing_advisor
+    return clothing_advisor
+
+
+def _entity_extractor():
+    from memory.entity_extractor import entity_extractor
+    return entity_extractor
 
 
 def _extract_day_activity_names(day: Any) -> list[str]:
@@ -42,46 +90,42 @@ def _extract_day_activity_names(day: Any) -> list[str]:
     return list(dict.fromkeys(names))
 
 
+# 活动标签规则：每组关键词预编译成一个正则（模块加载时一次），匹配交给 re 的 C 实现
+_TAG_PATTERNS: list[tuple[str, re.Pattern]] = [
+    (tag, re.compile("|".join(map(re.escape, words))))
+    for tag, words in [
+        ("爬山/徒步（出汗+风大+上下坡）", ["山", "岭", "峰", "徒步", "登高", "爬"]),
+        ("户外长时间（防风/防晒/耐走）", ["湿地", "公园", "植物园", "湖", "江", "西湖", "钱塘江", "游船"]),
+        ("室内为主（温差/空调/体面）", ["博物馆", "美术馆", "展", "大剧院", "剧院"]),
+        ("寺庙/人文（端庄+好走）", ["寺", "庙", "灵隐", "祠"]),
+        ("夜间活动（降温+拍照）", ["夜景", "夜游", "演出", "千古情", "秀"]),
+        ("Citywalk/拍照（轻便+上镜）", ["古街", "街区", "citywalk", "暴走", "打卡", "拍照"]),
+    ]
+]
+
+
 def _infer_activity_tags(activity_names: list[str]) -> list[str]:
     """
     从活动/景点名称粗略推断穿搭相关标签，用于让 LLM 更“按场景说话”
     """
     text = " ".join(activity_names)
-    tags: list[str] = []
-
-    def hit(words: list[str]) -> bool:
-        return any(w in text for w in words)
-
-    if hit(["山", "岭", "峰", "徒步", "登高", "爬"]):
-        tags.append("爬山/徒步（出汗+风大+上下坡）")
-    if hit(["湿地", "公园", "植物园", "湖", "江", "西湖", "钱塘江", "游船"]):
-        tags.append("户外长时间（防风/防晒/耐走）")
-    if hit(["博物馆", "美术馆", "展", "大剧院", "剧院"]):
-        tags.append("室内为主（温差/空调/体面）")
-    if hit(["寺", "庙", "灵隐", "祠"]):
-        tags.append("寺庙/人文（端庄+好走）")
-    if hit(["夜景", "夜游", "演出", "千古情", "秀"]):
-        tags.append("夜间活动（降温+拍照）")
-    if hit(["古街", "街区", "citywalk", "暴走", "打卡", "拍照"]):
-        tags.append("Citywalk/拍照（轻便+上镜）")
+    tags = [tag for tag, pat in _TAG_PATTERNS if pat.search(text)]
 
     if not tags:
         tags.append("城市休闲（通用步行）")
 
-    return list(dict.fromkeys(tags))
+    return tags
 
 
 
-def node_rewrite(state: GraphState) -> dict:
+def _rewrite_update(r) -> dict:
     """
-    节点0: rewrite（规范化 + 槽位抽取 + 缺口识别）
+    rewrite 结果 -> state 更新（规范化 + 槽位抽取 + 缺口识别）
     策略：
     - 不做时间解析
     - 默认天数为 1 天游（缺失时）
     - 城市缺失：后续由 clarify_gate 强制追问并中止本轮
     """
-    r = rewriter.rewrite(state.user_input)
-
     if r.slots is None:
         slots = {}
     elif hasattr(r.slots, "model_dump"):
@@ -114,27 +158,19 @@ def node_rewrite(state: GraphState) -> dict:
         "need_clarification": r.need_clarification,
         "clarifying_questions": clarifying_questions,
         "duration_days_is_default": duration_days_is_default,
-        "current_node": "rewrite",
     }
 
 
-def node_intent_recognition(state: GraphState) -> dict:
+def _intent_update(state: GraphState, intent, rs: dict, duration_days_is_default: bool) -> dict:
     """
-    节点1: 意图识别 + 实体抽取
+    router 结果 + 本轮 rewrite 槽位 -> state 更新（意图 + 实体合并）
 
     ✅ 修复点：
     - 不要每轮整包覆盖 entities
-    - 本轮没抽到 cities 时，沿用历史 state.entities["cities"]
+    - 本轮没抽到 cities 时，沿用历史 state["entities"]["cities"]
     - preferences 做并集，duration_days 有新值就覆盖
     """
-    user_input = state.rewritten_query or state.user_input
-    current_date = str(date.today())
-
-    # 调用 Router 分析（本轮抽取）
-    intent = router.analyze(user_input, current_date)
-
     new_entities = dict(intent.extracted_entities or {})
-    rs = state.rewrite_slots or {}
 
     # 用 rewrite_slots 补强本轮抽取
     if rs.get("cities") and not new_entities.get("cities"):
@@ -143,7 +179,7 @@ def node_intent_recognition(state: GraphState) -> dict:
     if (
             rs.get("duration_days")
             and not new_entities.get("duration_days")
-            and not getattr(state, "duration_days_is_default", False)
+            and not duration_days_is_default
     ):
         new_entities["duration_days"] = rs["duration_days"]
 
@@ -157,7 +193,7 @@ def node_intent_recognition(state: GraphState) -> dict:
         new_entities["dates"] = [rs["dates_text"]]
 
     # ✅ 与历史 entities 合并（保留“已确认信息”）
-    merged = dict(state.entities or {})
+    merged = dict(state.get("entities") or {})
 
     # cities：本轮有就覆盖，本轮没有就保留历史
     if new_entities.get("cities"):
@@ -189,35 +225,109 @@ def node_intent_recognition(state: GraphState) -> dict:
         merged["budget"] = new_entities["budget"]
 
     # ✅ 累积排除的景点（跨轮继承）
-    old_excluded = list(state.excluded_places or [])
+    old_excluded = list(state.get("excluded_places") or [])
     new_excluded = new_entities.get("excluded_places") or []
 
     # ✅ 累积想去的景点（跨轮继承）
-    old_included = list(state.included_places or [])
+    old_included = list(state.get("included_places") or [])
     new_included = new_entities.get("included_places") or []
     merged_included = list(dict.fromkeys(old_included + new_included))  # 去重保序
 
-    # ✅ 如果用户说"还是想去XX"，从排除列表中移除
-    merged_excluded = []
-    for place in dict.fromkeys(old_excluded + new_excluded):
-        # 检查是否与任何 included_place 匹配（模糊匹配）
-        should_exclude = True
-        for inc in merged_included:
-            if inc in place or place in inc:
-                should_exclude = False
-                break
-        if should_exclude:
-            merged_excluded.append(place)
+    # ✅ 如果用户说"还是想去XX"，从排除列表中移除（双向子串模糊匹配）
+    candidates = list(dict.fromkeys(old_excluded + new_excluded))
+    if not merged_included:
+        merged_excluded = candidates
+    else:
+        # inc 是 place 的子串：所有 included 合成一个正则，一次扫描 place
+        inc_rx = re.compile("|".join(map(re.escape, merged_included)))
+        # place 是 inc 的子串：included 用 \x00 拼成一个串做一次 in（place 不含 \x00，不会跨条命中）
+        inc_joined = "\x00".join(merged_included)
+        merged_excluded = [
+            place for place in candidates
+            if not (inc_rx.search(place) or place in inc_joined)
+        ]
 
     return {
         "intent": intent,
         "entities": merged,
         "excluded_places": merged_excluded,
         "included_places": merged_included,
-        "current_node": "intent_recognition",
     }
 
 
+# 语义缓存的硬约束：数字、城市、否定词必须完全一致才可复用（"玩2天"≠"玩3天"，"想去"≠"不想去"）
+def _semantic_guard_rx() -> re.Pattern:
+    def _make():
+        from tools.weather import CITY_CODES
+        return re.compile(
+            "|".join([r"\d+", r"[零一二两三四五六七八九十百千万]+", r"[不别没]"] + [re.escape(c) for c in CITY_CODES])
+        )
+    return _lazy("semantic_guard_rx", _make)
+
+
+async def _rewrite_and_analyze(user_input: str, current_date: str):
+    """
+    并发调用 rewrite + router
+    开启语义缓存时先查近似输入（按日期隔离，日期相对词在不同天含义不同）；两者都是 temperature=0 的确定性调用
+    """
+    if not config.semantic_cache:
+        return await asyncio.gather(
+            _rewriter().rewrite_async(user_input, current_date),
+            _router().analyze_async(user_input, current_date),
+        )
+
+    from utils.llm import get_embeddings, semantic_cache
+    vec = await asyncio.to_thread(get_embeddings().embed_query, user_input)
+    guard = tuple(_semantic_guard_rx().findall(user_input))
+    hit = semantic_cache.get(vec, namespace=current_date, guard=guard)
+    if hit is not None:
+        # UserIntent / RewriteResult 都是只读模型，可直接复用
+        return hit
+
+    r, intent = await asyncio.gather(
+        _rewriter().rewrite_async(user_input, current_date),
+        _router().analyze_async(user_input, current_date),
+    )
+    semantic_cache.set(vec, (r, intent), namespace=current_date, guard=guard)
+    return r, intent
+
+
+async def node_rewrite_and_route(state: GraphState) -> dict:
+    """
+    节点0+1: rewrite 与意图识别并发执行
+    两者都只依赖原始 user_input，互不依赖，合并成一个节点后用 asyncio.gather 同时发起两次 LLM 调用
+    """
+    user_input = state.get("user_input") or ""
+    current_date = today_str()
+
+    # 快速通道命中闲聊：无需改写/抽槽，两次 LLM 调用都省掉
+    intent = _router().fast_path(user_input)
+    if intent is not None and intent.intent_type == "general_chat":
+        update = {
+            "rewritten_query": user_input,
+            "rewrite_slots": {},
+            "need_clarification": False,
+            "clarifying_questions": [],
+            "duration_days_is_default": False,
+        }
+    else:
+        r, intent = await _rewrite_and_analyze(user_input, current_date)
+        update = _rewrite_update(r)
+
+    update.update(
+        _intent_update(state, intent, update["rewrite_slots"], update["duration_days_is_default"])
+    )
+    update["user_input_lower"] = user_input.lower()
+    update["current_node"] = "rewrite_and_route"
+    return update
+
+
+# clarify_gate 的 follow-up 关键词（模块加载时编译）
+_RX_PLAN = re.compile("之前|上面|刚才|行程|出行计划|旅行计划|按行程|结合行程")
+_RX_OUTFIT = re.compile("穿搭|衣服|带什么|怎么穿|配套|outfit|穿什么")
+_RX_ACT_OUTFIT = re.compile("根据我的活动|按活动|按我的活动|活动和气温|场景|配套|穿搭方案|一身|outfit")
+
+
 def node_clarify_gate(state: GraphState) -> dict:
     """
     节点1.5: 澄清门控（B策略：尽量少问，先给方案）
@@ -226,9 +336,10 @@ def node_clarify_gate(state: GraphState) -> dict:
     - trip_planning/clothing_advice 缺城市：必须问，直接结束本轮
     - 不缺城市：继续（clarify_only=False）
     """
-    entities = state.entities or {}
+    entities = state.get("entities") or {}
     cities = entities.get("cities") or []
-    intent_type = state.intent.intent_type if state.intent else "unknown"
+    intent = state.get("intent")
+    intent_type = intent.intent_type if intent else "unknown"
 
     # ✅ general_qa 不需要强制城市，直接放行
     if intent_type == "general_qa":
@@ -256,89 +367,130 @@ def node_clarify_gate(state: GraphState) -> dict:
 
     # ✅ follow-up 纠偏：用户说"结合之前行程/出行计划/上面的计划" => 优先按穿搭继续
     # 典型：上一轮刚生成 trip_plan，用户问"按行程给配套穿搭/带什么衣服"
-    text_raw = f"{state.user_input or ''}\n{state.rewritten_query or ''}"
-    text = text_raw.lower()
+    text = f"{state.get('user_input_lower') or ''}\n{(state.get('rewritten_query') or '').lower()}"
 
-    hit_plan = any(k in text for k in ["之前", "上面", "刚才", "行程", "出行计划", "旅行计划", "按行程", "结合行程"])
-    hit_outfit = any(k in text for k in ["穿搭", "衣服", "带什么", "怎么穿", "配套", "outfit", "穿什么"])
+    hit_plan = bool(_RX_PLAN.search(text))
+    hit_outfit = bool(_RX_OUTFIT.search(text))
 
     # 如果已有行程，并且用户在引用"行程/之前"，就把它当成穿搭 follow-up
-    if state.trip_plan and hit_plan and (hit_outfit or "建议" in text):
+    # intent 是只读模型：覆写时生成副本，随本节点的返回值写回 state
+    update: dict = {}
+    if state.get("trip_plan") and hit_plan and (hit_outfit or "建议" in text):
         # 方式1：直接覆写 intent（最有效）
-        if state.intent:
-            state.intent.intent_type = "clothing_advice"
-            state.intent.confidence = max(getattr(state.intent, "confidence", 0.0), 0.9)
+        if intent:
+            update["intent"] = intent.model_copy(update={
+                "intent_type": "clothing_advice",
+                "confidence": max(intent.confidence, 0.9),
+            })
         intent_type = "clothing_advice"
 
     # ✅ 新增：穿搭配套需要活动/场景
-    text = f"{state.user_input or ''}\n{state.rewritten_query or ''}".lower()
-    wants_activity_based_outfit = any(k in text for k in [
-        "根据我的活动", "按活动", "按我的活动", "活动和气温", "场景", "配套", "穿搭方案", "一身", "outfit"
-    ])
+    wants_activity_based_outfit = bool(_RX_ACT_OUTFIT.search(text))
 
     prefs = entities.get("preferences") or []
     if intent_type == "clothing_advice" and wants_activity_based_outfit and not prefs:
         q = "你这次主要会有哪些活动/场景？（例如：城市暴走/拍照、徒步登山、看展、夜景、亲子、商务/通勤）"
         return {
+            **update,
             "final_response": f"我可以按活动+气温给你每天一套配套穿搭。开始前我想确认：\n- {q}",
             "clarify_only": True,
             "current_node": "clarify_gate",
         }
 
     return {
+        **update,
         "clarify_only": False,
         "current_node": "clarify_gate",
     }
 
 
-def node_load_memory(state: GraphState) -> dict:
+async def node_load_memory(state: GraphState) -> dict:
     """
-    节点2: 加载用户记忆
+    节点2: 加载用户记忆（相关记忆检索与画像读取并发执行）
     """
-    query = state.rewritten_query or state.user_input
-    relevant_memories = user_memory.search_relevant(query, k=3)
-    profile = user_memory.get_user_profile()
+    query = state.get("rewritten_query") or state.get("user_input") or ""
+    memory = get_user_memory()
+
+    # 查询与偏好版本都没变（如"再改下预算"这类追问）：沿用上一轮的画像，不再查向量库
+    # 本会话上一轮的后台写入还没完成时不跳过（版本号尚未反映新偏好）；也不等待它，写入始终不占关键路径
+    h = hashlib.blake2b(query.encode("utf-8"), digest_size=16)
+    h.update(str(memory.pref_version).encode())
+    query_hash = h.hexdigest()
+    own_write_pending = state.get("memory_write_id") in _WRITES_BY_ID
+    if (not own_write_pending and query_hash == state.get("last_memory_query_hash")
+            and state.get("user_profile")):
+        return {"current_node": "load_memory"}
+
+    relevant_memories, profile = await asyncio.gather(
+        memory.asearch_relevant(query, k=3),
+        memory.aget_user_profile(),
+    )
 
     return {
         "user_profile": {"relevant_memories": relevant_memories, "profile": profile},
+        "last_memory_query_hash": query_hash,
         "current_node": "load_memory",
     }
 
 
-def node_fetch_weather(state: GraphState) -> dict:
+async def node_fetch_weather(state: GraphState) -> dict:
     """
     节点3: 获取天气数据
     - 行程规划：实时天气
     - 穿搭建议：若用户问 N 天游，则拉取未来 N 天预报
+    - 多城市并发查询（单个城市失败不影响其它城市）
     """
-    entities = state.entities or {}
+    entities = state.get("entities") or {}
     cities = entities.get("cities", []) or []
     duration_days = int(entities.get("duration_days") or 1)
 
-    intent_type = state.intent.intent_type if state.intent else "unknown"
-    weather_data = {}
+    intent = state.get("intent")
+    intent_type = intent.intent_type if intent else "unknown"
+    want_forecast = intent_type == "clothing_advice" and duration_days > 1
 
-    for city in cities:
-        if intent_type == "clothing_advice" and duration_days > 1:
-            weather_data[city] = weather_tool.get_forecast(city, days=duration_days)
-        else:
-            weather_data[city] = weather_tool.get_weather(city)
+    async def _fetch(city: str):
+        if want_forecast:
+            return await _weather_tool().get_forecast_async(city, days=duration_days)
+        return await _weather_tool().get_weather_async(city)
 
-    if not cities:
-        if intent_type == "clothing_advice" and duration_days > 1:
-            weather_data["北京"] = weather_tool.get_forecast("北京", days=duration_days)
-        else:
-            weather_data["北京"] = weather_tool.get_weather("北京")
+    # 去重保序；没有城市时默认北京，和其它城市走同一条并发路径（失败同样兜底）
+    cities = list(dict.fromkeys(cities)) or ["北京"]
+
+    weather_data = {}
+    results = await asyncio.gather(*[_fetch(c) for c in cities], return_exceptions=True)
+    for city, res in zip(cities, results):
+        if isinstance(res, Exception):
+            res = WeatherInfo(city=city, weather="查询失败", suggestion=f"天气查询异常: {res}")
+            if want_forecast:
+                res = [res]
+        weather_data[city] = res
 
     return {"weather_data": weather_data, "current_node": "fetch_weather"}
 
 
-def node_clothing_advice(state: GraphState) -> dict:
+async def node_load_context(state: GraphState) -> dict:
+    """
+    节点2+3: 记忆加载与天气查询并发执行
+    两者互不依赖（记忆看改写后的查询，天气看实体里的城市），一起等待，省掉一次串行的网络/向量库往返
+    """
+    memory_update, weather_update = await asyncio.gather(
+        node_load_memory(state),
+        node_fetch_weather(state),
+    )
+    return {**memory_update, **weather_update, "current_node": "load_context"}
+
+
+# mock 预报的占位日期（Day1 / Day 2）；只有序号与当天一致时才算占位
+_DAY_RX = re.compile(r"day ?(\d+)", re.I)
+
+
+async def node_clothing_advice(state: GraphState) -> dict:
     """
     节点4a: 多日穿搭建议（方案 B）
+    每天一次 LLM 调用，彼此独立，并发发起（按天顺序拼接结果）
     """
-    weather_data = state.weather_data or {}
-    entities = state.entities or {}
+    weather_data = state.get("weather_data") or {}
+    entities = state.get("entities") or {}
     duration_days = int(entities.get("duration_days") or 1)
 
     # 取第一个城市
@@ -347,21 +499,27 @@ def node_clothing_advice(state: GraphState) -> dict:
         wobj = weather_data[city]
     else:
         city = "北京"
-        wobj = weather_tool.get_weather(city)
+        wobj = await _weather_tool().get_weather_async(city)
 
     # 用户上下文（记忆 + 结构化偏好/活动）
-    entities = state.entities or {}
+    entities = state.get("entities") or {}
     prefs = entities.get("preferences") or []
 
     user_context_parts = []
 
+    trip_plan = state.get("trip_plan")
+    plan_days = getattr(trip_plan, "days", None) or []
+    # 每天的活动名/标签只提取一次：行程摘要和逐日绑定共用
+    day_act_names = [_extract_day_activity_names(d) for d in plan_days]
+    day_tags = [_infer_activity_tags(names) for names in day_act_names]
+
     # ✅ 把已生成的行程摘要喂给穿搭模型：让它按“当天活动强度/场景”配套
-    if state.trip_plan and getattr(state.trip_plan, "days", None):
-        lines = []
-        for d in state.trip_plan.days:
-            act_names = _extract_day_activity_names(d)
-            if act_names:
-                lines.append(f"- {d.date} {d.city}: " + "、".join(act_names[:4]))
+    if plan_days:
+        lines = [
+            f"- {d.date} {d.city}: " + "、".join(names[:4])
+            for d, names in zip(plan_days, day_act_names)
+            if names
+        ]
         if lines:
             user_context_parts.append("已生成行程（用于配套穿搭）:\n" + "\n".join(lines))
 
@@ -370,12 +528,14 @@ def node_clothing_advice(state: GraphState) -> dict:
         user_context_parts.append(f"活动/场景/偏好: {', '.join(prefs)}")
 
     # 保留用户原话（用于补充细节）
-    if state.user_input:
-        user_context_parts.append(f"用户原话: {state.user_input}")
+    user_input = state.get("user_input")
+    if user_input:
+        user_context_parts.append(f"用户原话: {user_input}")
 
     # 追加记忆
-    if state.user_profile and state.user_profile.get("relevant_memories"):
-        memories = [m["content"] for m in state.user_profile["relevant_memories"] if m.get("content")]
+    user_profile = state.get("user_profile") or {}
+    if user_profile.get("relevant_memories"):
+        memories = [m["content"] for m in user_profile["relevant_memories"] if m.get("content")]
         if memories:
             user_context_parts.append(f"用户偏好/记忆: {', '.join(memories)}")
 
@@ -390,18 +550,17 @@ def node_clothing_advice(state: GraphState) -> dict:
         forecast = [wobj]
         header = f"🌤️ **{wobj.city}** 今日穿搭建议"
 
-    blocks = [header]
-
+    prepped = []  # (title, line, day_user_context, w)
     for i, w in enumerate(forecast, 1):
-        raw = w.raw_data or {}
-        date_text = (raw.get("date") or "").strip()
-        # 过滤 mock 的占位日期（Day1/Day2 这类）
-        if date_text.lower() in {f"day{i}".lower(), f"day {i}".lower()}:
+        raw_get = (w.raw_data or {}).get
+        date_text = (raw_get("date") or "").strip()
+        # 过滤 mock 的占位日期（第 i 天的 Day{i} / Day {i}）
+        m = _DAY_RX.fullmatch(date_text)
+        if m and m.group(1) == str(i):
             date_text = ""
-        daytemp = raw.get("daytemp")
-        nighttemp = raw.get("nighttemp")
-        dayweather = raw.get("dayweather") or w.weather
-        nightweather = raw.get("nightweather")
+        daytemp, nighttemp, dayweather, nightweather = (
+            raw_get("daytemp"), raw_get("nighttemp"), raw_get("dayweather") or w.weather, raw_get("nightweather")
+        )
 
         title = f"### Day {i}" + (f" - {date_text}" if date_text else "")
         if daytemp is not None and nighttemp is not None:
@@ -412,12 +571,10 @@ def node_clothing_advice(state: GraphState) -> dict:
             line = f"- 预报：{w.weather}（体感参考约 {w.temperature}°C）"
 
         # ✅ 逐日行程绑定：取第 i 天的活动，单独喂给模型
-        activity_names = []
-        if state.trip_plan and getattr(state.trip_plan, "days", None) and len(state.trip_plan.days) >= i:
-            d = state.trip_plan.days[i - 1]
-            activity_names = _extract_day_activity_names(d)
-
-        tags = _infer_activity_tags(activity_names)
+        if i <= len(day_act_names):
+            activity_names, tags = day_act_names[i - 1], day_tags[i - 1]
+        else:
+            activity_names, tags = [], _infer_activity_tags([])
 
         if activity_names:
             day_plan_text = "当天活动: " + "、".join(activity_names[:6])
@@ -431,10 +588,22 @@ def node_clothing_advice(state: GraphState) -> dict:
                 + "硬性要求：summary 必须以“考虑到你今天要【活动/地点】（【活动标签】），结合当日【白天xx°C/夜间xx°C+天气】，建议：”开头。"
         )
 
-        advice = clothing_advisor.advise(w, day_user_context)
-        formatted = clothing_advisor.format_advice(advice)
+        prepped.append((title, line, day_user_context, w))
+
+    # 每天完成即推送该天的穿搭块（stream_mode="custom"），不必等最慢的一天；最终结果仍按天顺序拼接
+    writer = get_stream_writer()
+    writer({"node": "clothing_advice", "header": header})
 
-        blocks.append("\n".join([title, line, "", formatted]).strip())
+    async def _day_block(i: int, title: str, line: str, ctx: str, w) -> str:
+        advice = await _clothing_advisor().aadvise(w, ctx)
+        block = "\n".join([title, line, "", _clothing_advisor().format_advice(advice)]).strip()
+        writer({"node": "clothing_advice", "day": i, "block": block})
+        return block
+
+    blocks = [header]
+    blocks += await asyncio.gather(*[
+        _day_block(i, title, line, ctx, w) for i, (title, line, ctx, w) in enumerate(prepped, 1)
+    ])
 
     response = "\n\n".join(blocks).strip()
 
@@ -445,6 +614,12 @@ def node_clothing_advice(state: GraphState) -> dict:
     }
 
 
+# activity dict 中兼容的 key（按优先级），以及不进入 meta 的保留 key
+_NAME_KEYS = ("name", "title", "place", "spot", "activity")
+_DESC_KEYS = ("desc", "description", "note", "tips")
+_RESERVED = frozenset(_NAME_KEYS + _DESC_KEYS + ("time",))
+
+
 def _normalize_activity(a: Any) -> dict:
     """
     把任意 activity 结构归一化成统一 dict：
@@ -465,38 +640,24 @@ def _normalize_activity(a: Any) -> dict:
     if isinstance(a, dict):
         # 兼容不同 key
         name = ""
-        for k in ("name", "title", "place", "spot", "activity"):
+        for k in _NAME_KEYS:
             v = a.get(k)
             if isinstance(v, str) and v.strip():
                 name = v.strip()
                 break
 
-        time = a.get("time") if isinstance(a.get("time"), str) else ""
+        time = a.get("time")
+        if not isinstance(time, str):
+            time = ""
 
         desc = ""
-        for k in ("desc", "description", "note", "tips"):
+        for k in _DESC_KEYS:
             v = a.get(k)
             if isinstance(v, str) and v.strip():
                 desc = v.strip()
                 break
 
-        meta = {
-            k: v
-            for k, v in a.items()
-            if k
-            not in (
-                "time",
-                "name",
-                "title",
-                "place",
-                "spot",
-                "activity",
-                "desc",
-                "description",
-                "note",
-                "tips",
-            )
-        }
+        meta = {k: v for k, v in a.items() if k not in _RESERVED}
 
         return {"time": time, "name": name or "行程活动", "description": desc, "meta": meta}
 
@@ -512,44 +673,55 @@ def _normalize_activities(activities: Any) -> list[dict]:
         return [_normalize_activity(x) for x in activities]
     return [_normalize_activity(activities)]
 
+# 行程调整类型：每类一个命名分组，合成一个正则（模块加载时编译一次）
+_ADJ_KEYWORDS = {
+    "up": ["预算高", "预算充足", "贵点", "更好", "高端", "豪华"],
+    "down": ["预算低", "预算不够", "便宜", "省钱", "经济", "实惠"],
+    "busy": ["热闹", "人多", "繁华", "商业"],
+    "quiet": ["安静", "清净", "人少", "小众"],
+    "fun": ["好玩", "有趣", "刺激", "特色"],
+}
+_ADJ_ORDER = tuple(_ADJ_KEYWORDS)  # 同时命中多类时的优先级
+_ADJ_RX = re.compile("|".join(
+    f"(?P<{k}>{'|'.join(map(re.escape, words))})" for k, words in _ADJ_KEYWORDS.items()
+))
+_ADJ_HINTS = {
+    "up": "用户预算提高了，请推荐更高端、更有特色的景点和餐厅，必须与之前的行程有明显区别！",
+    "down": "用户预算降低了，请推荐更经济实惠的景点和餐厅，优先免费景点和平价美食，必须与之前的行程有明显区别！",
+    "busy": "用户想要更热闹的地方，请推荐人气旺、商业繁华的景点，必须与之前的行程有明显区别！",
+    "quiet": "用户想要更安静的地方，请推荐人少、小众的景点，必须与之前的行程有明显区别！",
+    "fun": "用户想要更好玩的地方，请推荐更有特色、更有趣的景点和活动，必须与之前的行程有明显区别！",
+}
+
+# 天气风险等级：暴雨/暴雪/雪为高风险，其余含"雨"为中风险
+_RX_HIGH = re.compile("暴|雪")
+_RX_MED = re.compile("雨")
+
+
 def node_trip_planning(state: GraphState) -> dict:
     """
     节点4b: 行程规划 (trip_planning 分支)
     """
     from agents.planner import trip_planner
 
-    weather_payload = {}
-    for city, w in (state.weather_data or {}).items():
-        if isinstance(w, list):
-            weather_payload[city] = [x.model_dump() for x in w]
-        elif w is None:
-            weather_payload[city] = None
-        else:
-            weather_payload[city] = w.model_dump()
-
-    # ✅ 检测用户的调整类型
-    user_input_lower = (state.user_input or "").lower()
+    # ✅ 检测用户的调整类型（一次扫描收集命中的类型，按 _ADJ_ORDER 优先级取第一个）
+    user_input_lower = state.get("user_input_lower") or ""
     adjustment_hint = ""
-    if state.trip_plan:  # 如果已有行程，检测用户想要什么调整
-        if any(kw in user_input_lower for kw in ["预算高", "预算充足", "贵点", "更好", "高端", "豪华"]):
-            adjustment_hint = "用户预算提高了，请推荐更高端、更有特色的景点和餐厅，必须与之前的行程有明显区别！"
-        elif any(kw in user_input_lower for kw in ["预算低", "预算不够", "便宜", "省钱", "经济", "实惠"]):
-            adjustment_hint = "用户预算降低了，请推荐更经济实惠的景点和餐厅，优先免费景点和平价美食，必须与之前的行程有明显区别！"
-        elif any(kw in user_input_lower for kw in ["热闹", "人多", "繁华", "商业"]):
-            adjustment_hint = "用户想要更热闹的地方，请推荐人气旺、商业繁华的景点，必须与之前的行程有明显区别！"
-        elif any(kw in user_input_lower for kw in ["安静", "清净", "人少", "小众"]):
-            adjustment_hint = "用户想要更安静的地方，请推荐人少、小众的景点，必须与之前的行程有明显区别！"
-        elif any(kw in user_input_lower for kw in ["好玩", "有趣", "刺激", "特色"]):
-            adjustment_hint = "用户想要更好玩的地方，请推荐更有特色、更有趣的景点和活动，必须与之前的行程有明显区别！"
+    if state.get("trip_plan"):  # 如果已有行程，检测用户想要什么调整
+        hit = {m.lastgroup for m in _ADJ_RX.finditer(user_input_lower)}
+        key = next((k for k in _ADJ_ORDER if k in hit), None)
+        if key:
+            adjustment_hint = _ADJ_HINTS[key]
 
     context = {
-        "user_input": state.user_input,
-        "entities": state.entities,
-        "weather_data": weather_payload,
-        "user_profile": state.user_profile,
-        "previous_plan": state.trip_plan,  # 传递之前的行程，用于修改/调整
-        "excluded_places": state.excluded_places,  # 传递排除的景点列表
-        "included_places": state.included_places,  # 传递想去的景点列表
+        "user_input": state.get("user_input") or "",
+        "entities": state.get("entities") or {},
+        # WeatherInfo 是只读模型，planner 直接使用，无需 model_dump 成 dict 再重建
+        "weather_data": state.get("weather_data") or {},
+        "user_profile": state.get("user_profile") or {},
+        "previous_plan": state.get("trip_plan"),  # 传递之前的行程，用于修改/调整
+        "excluded_places": state.get("excluded_places") or [],  # 传递排除的景点列表
+        "included_places": state.get("included_places") or [],  # 传递想去的景点列表
         "adjustment_hint": adjustment_hint,  # 传递调整提示
     }
 
@@ -562,12 +734,13 @@ def node_trip_planning(state: GraphState) -> dict:
 
     needs_replan = False
     for day in plan.days:
-        if day.weather and "雨" in day.weather.weather:
-            day.risk_level = "medium"
-            needs_replan = True
-        if day.weather and ("暴" in day.weather.weather or "雪" in day.weather.weather):
+        w = day.weather.weather if day.weather else ""
+        if _RX_HIGH.search(w):
             day.risk_level = "high"
             needs_replan = True
+        elif _RX_MED.search(w):
+            day.risk_level = "medium"
+            needs_replan = True
 
     return {
         "trip_plan": plan,
@@ -580,12 +753,12 @@ def node_risk_assessment(state: GraphState) -> dict:
     """
     节点5: 风险评估与备选方案
     """
-    if not state.needs_replan or not state.trip_plan:
+    if not state.get("needs_replan") or not state.get("trip_plan"):
         return {"current_node": "risk_assessment"}
 
     from agents.planner import trip_planner
 
-    plan = state.trip_plan
+    plan = state.get("trip_plan")
     for day in plan.days:
         if day.risk_level in ["medium", "high"]:
             day.backup_plan = trip_planner.generate_backup(day)
@@ -597,20 +770,21 @@ def node_format_response(state: GraphState) -> dict:
     """
     节点6: 格式化最终响应
     """
-    intent_type = state.intent.intent_type if state.intent else "unknown"
+    intent = state.get("intent")
+    intent_type = intent.intent_type if intent else "unknown"
 
-    if state.final_response:
+    if state.get("final_response"):
         return {"current_node": "format_response"}
 
     if intent_type == "clothing_advice":
         return {"current_node": "format_response"}
 
-    elif intent_type == "trip_planning" and state.trip_plan:
-        response = format_trip_plan(state.trip_plan)
+    elif intent_type == "trip_planning" and state.get("trip_plan"):
+        response = format_trip_plan(state["trip_plan"])
 
         # 过滤掉已经有答案的澄清问题
-        questions = state.clarifying_questions or []
-        entities = state.entities or {}
+        questions = state.get("clarifying_questions") or []
+        entities = state.get("entities") or {}
         filtered_questions = []
         for q in questions:
             q_lower = q.lower()
@@ -622,7 +796,7 @@ def node_format_response(state: GraphState) -> dict:
                 continue
             filtered_questions.append(q)
 
-        if filtered_questions and not state.clarify_only:
+        if filtered_questions and not state.get("clarify_only"):
             response += "\n\n---\n### 需要你确认\n" + "\n".join([f"- {q}" for q in filtered_questions[:2]])
 
         return {"final_response": response, "current_node": "format_response"}
@@ -634,67 +808,136 @@ def node_format_response(state: GraphState) -> dict:
         }
 
 
-def node_update_memory(state: GraphState) -> dict:
+def _pref_field(pref, key: str, default=None):
+    # dict
+    if isinstance(pref, dict):
+        return pref.get(key, default)
+    # pydantic v2
+    if hasattr(pref, "model_dump"):
+        return pref.model_dump().get(key, default)
+    # pydantic v1
+    if hasattr(pref, "dict"):
+        return pref.dict().get(key, default)
+    # 普通对象 / dataclass
+    return getattr(pref, key, default)
+
+
+# 后台记忆写入任务：保留强引用（事件循环只持有弱引用），完成后自动移除
+_PENDING_WRITES: set[asyncio.Task] = set()
+# 写入 id -> 未完成的任务（id 记在 state.memory_write_id，下一轮据此判断本会话的写入是否已完成）
+_WRITES_BY_ID: dict[str, asyncio.Task] = {}
+
+
+async def flush_memory_writes() -> None:
+    """等待本事件循环上尚未完成的后台记忆写入，并把写缓冲落盘（读取画像 / 清空 / 退出前调用）"""
+    loop = asyncio.get_running_loop()
+    pending = [t for t in _PENDING_WRITES if t.get_loop() is loop]
+    if pending:
+        await asyncio.gather(*pending, return_exceptions=True)
+    memory = _LAZY.get("user_memory")  # 未初始化过就没有缓冲，不必为此加载 Chroma
+    if memory is not None:
+        await asyncio.to_thread(memory.flush)
+
+
+async def _persist_memory(user_input: str, final_response: str, budget_text) -> None:
+    """偏好抽取（LLM）+ 批量写入向量库；在后台执行，不阻塞本轮回复"""
+    try:
+        conversation = f"用户: {user_input}\n助手: {final_response}"
+        extracted = await _entity_extractor().aextract(conversation)
+
+        # 本轮所有写入攒成一批：一次 embedding 调用 + 一次向量库写入
+        entries = []
+        if budget_text:
+            entries.append({"content": str(budget_text), "category": "budget", "source": "rewrite"})
+
+        if getattr(extracted, "has_new_info", False):
+            for pref in (getattr(extracted, "preferences", None) or []):
+                content = _pref_field(pref, "content")
+                category = _pref_field(pref, "category")
+                if not content or not category:
+                    continue
+                entries.append({"content": str(content), "category": str(category), "source": "conversation"})
+
+        entries.append({
+            "content": f"用户询问: {(user_input or '')[:100]}...",
+            "type": "interaction",
+        })
+        memory = get_user_memory()
+        await memory.aadd_many(entries)
+        # 一轮结束即落盘（仍在后台），下一轮读取时不必再等写入
+        await asyncio.to_thread(memory.flush)
+    except Exception as e:
+        print(f"⚠️ 记忆更新失败: {e}")
+
+
+async def node_update_memory(state: GraphState) -> dict:
     """
     节点7: 更新用户记忆 (后台任务)
+    偏好抽取 + 写入放到后台 task，节点立即返回；需要读到最新画像时先 await flush_memory_writes()
     """
-    conversation = f"用户: {state.user_input}\n助手: {state.final_response}"
-    extracted = entity_extractor.extract(conversation)
+    rs = state.get("rewrite_slots") or {}
+    task = asyncio.create_task(_persist_memory(
+        state.get("user_input") or "",
+        state.get("final_response") or "",
+        rs.get("budget_text"),
+    ))
+    write_id = uuid.uuid4().hex
+    _PENDING_WRITES.add(task)
+    _WRITES_BY_ID[write_id] = task
 
-    rs = state.rewrite_slots or {}
-    budget_text = rs.get("budget_text")
+    def _done(t: asyncio.Task) -> None:
+        _PENDING_WRITES.discard(t)
+        _WRITES_BY_ID.pop(write_id, None)
 
-    if budget_text:
-        user_memory.add_preference(
-            content=str(budget_text),
-            category="budget",
-            source="rewrite",
-        )
+    task.add_done_callback(_done)
 
-    def _get(pref, key: str, default=None):
-        # dict
-        if isinstance(pref, dict):
-            return pref.get(key, default)
-        # pydantic v2
-        if hasattr(pref, "model_dump"):
-            return pref.model_dump().get(key, default)
-        # pydantic v1
-        if hasattr(pref, "dict"):
-            return pref.dict().get(key, default)
-        # 普通对象 / dataclass
-        return getattr(pref, key, default)
-
-    if getattr(extracted, "has_new_info", False):
-        for pref in (getattr(extracted, "preferences", None) or []):
-            content = _get(pref, "content")
-            category = _get(pref, "category")
-            if not content or not category:
-                continue
+    return {"memory_write_id": write_id, "current_node": "update_memory"}
 
-            user_memory.add_preference(
-                content=str(content),
-                category=str(category),
-                source="conversation",
-            )
 
-    user_memory.add_memory(
-        f"用户询问: {state.user_input[:100]}...",
-        memory_type="interaction",
-    )
+# ===== general_qa：prompt 模块加载时构建一次；chain 首次使用时构建，之后节点内只做 invoke =====
+_GENERAL_QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """你是 IntelliGo 智能出行助手，专门回答旅行相关的问题。
+
+## 你的职责
+- 回答景点/地点的详细介绍（历史、特色、游玩建议）
+- 回答美食相关问题（特色菜、口味、推荐餐厅）
+- 回答交通相关问题（怎么去、多久、交通方式选择）
+- 回答健康出行问题（特定人群是否适合某活动/食物）
+- 回答旅行常识（证件、安全、注意事项）
+
+## 回答要求
+- 回答要简洁实用，重点突出
+- 如果有上下文信息，可以结合用户之前的行程来回答
+- 语气亲切自然，像朋友推荐一样
+
+## 上下文信息
+{context}
 
-    return {"current_node": "update_memory"}
+{health_disclaimer}"""),
+    ("human", "{user_input}")
+])
+
+_GENERAL_QA_HEALTH_DISCLAIMER = """## 健康问题特别提醒
+涉及健康相关问题时，你需要：
+1. 给出通用的建议和参考信息
+2. 在回答末尾添加免责声明：「以上建议仅供参考，具体请咨询专业医生，根据个人身体状况做出判断。」"""
 
 
-def node_general_qa(state: GraphState) -> dict:
+def _general_qa_chain():
+    def _make():
+        from utils.llm import get_llm
+        return _GENERAL_QA_PROMPT | get_llm(temperature=0.7)
+    return _lazy("general_qa_chain", _make)
+
+
+async def node_general_qa(state: GraphState) -> dict:
     """
     节点: 通用旅行问答（general_qa）
     处理景点介绍、美食推荐、交通问题、健康出行建议等
+    流式生成：每个 token 通过 stream writer 推出（stream_mode="custom" 可收到），最终回答仍写入 state
     """
-    from langchain_core.prompts import ChatPromptTemplate
-    from utils.llm import get_llm
-
-    user_input = state.user_input or ""
-    entities = state.entities or {}
+    user_input = state.get("user_input") or ""
+    entities = state.get("entities") or {}
 
     # 判断是否涉及健康问题
     has_health_concern = entities.get("has_health_concern", False)
@@ -704,11 +947,12 @@ def node_general_qa(state: GraphState) -> dict:
     context_parts = []
 
     # 智能判断：如果之前有行程，且问题可能与行程相关，则提供上下文
-    if state.trip_plan and getattr(state.trip_plan, "days", None):
+    trip_plan = state.get("trip_plan")
+    if trip_plan and getattr(trip_plan, "days", None):
         # 提取行程中的景点和活动
         trip_places = []
         trip_foods = []
-        for day in state.trip_plan.days:
+        for day in trip_plan.days:
             if hasattr(day, "activities") and day.activities:
                 for act in day.activities:
                     name = act.get("name", "") if isinstance(act, dict) else str(act)
@@ -724,56 +968,30 @@ def node_general_qa(state: GraphState) -> dict:
         context_parts.append(f"相关城市: {', '.join(cities)}")
 
     # 用户画像/偏好
-    if state.user_profile and state.user_profile.get("relevant_memories"):
-        memories = [m["content"] for m in state.user_profile["relevant_memories"] if m.get("content")]
+    user_profile = state.get("user_profile") or {}
+    if user_profile.get("relevant_memories"):
+        memories = [m["content"] for m in user_profile["relevant_memories"] if m.get("content")]
         if memories:
             context_parts.append(f"用户偏好: {', '.join(memories[:5])}")
 
     context_str = "\n".join(context_parts) if context_parts else "无额外上下文"
 
-    # 构建 prompt
-    system_prompt = """你是 IntelliGo 智能出行助手，专门回答旅行相关的问题。
-
-## 你的职责
-- 回答景点/地点的详细介绍（历史、特色、游玩建议）
-- 回答美食相关问题（特色菜、口味、推荐餐厅）
-- 回答交通相关问题（怎么去、多久、交通方式选择）
-- 回答健康出行问题（特定人群是否适合某活动/食物）
-- 回答旅行常识（证件、安全、注意事项）
+    health_disclaimer = _GENERAL_QA_HEALTH_DISCLAIMER if has_health_concern else ""
 
-## 回答要求
-- 回答要简洁实用，重点突出
-- 如果有上下文信息，可以结合用户之前的行程来回答
-- 语气亲切自然，像朋友推荐一样
-
-## 上下文信息
-{context}
-
-{health_disclaimer}"""
-
-    health_disclaimer = ""
-    if has_health_concern:
-        health_disclaimer = """## 健康问题特别提醒
-涉及健康相关问题时，你需要：
-1. 给出通用的建议和参考信息
-2. 在回答末尾添加免责声明：「以上建议仅供参考，具体请咨询专业医生，根据个人身体状况做出判断。」"""
-
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", system_prompt),
-        ("human", "{user_input}")
-    ])
-
-    llm = get_llm(temperature=0.7)
-    chain = prompt | llm
-
-    response = chain.invoke({
+    writer = get_stream_writer()
+    parts = []
+    async for chunk in _general_qa_chain().astream({
         "context": context_str,
         "health_disclaimer": health_disclaimer,
         "user_input": user_input
-    })
-
-    # 提取回答内容
-    answer = response.content if hasattr(response, "content") else str(response)
+    }):
+        # 提取回答内容
+        delta = chunk.content if hasattr(chunk, "content") else str(chunk)
+        if delta:
+            parts.append(delta)
+            writer({"node": "general_qa", "delta": delta})
+
+    answer = "".join(parts)
 
     return {
         "final_response": answer,
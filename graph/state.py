@@ -1,13 +1,31 @@
 """
 LangGraph 状态定义 - IntelliGo 的"大脑记忆"
 """
-from typing import Annotated, Literal
-from pydantic import BaseModel, Field
+from types import MappingProxyType
+from typing import Annotated, Any, Literal, Mapping
+from typing_extensions import TypedDict  # pydantic 在 Python < 3.12 上只认 typing_extensions 版本
+from pydantic import BaseModel, ConfigDict, Field
+from langchain_core.messages import SystemMessage
 from langgraph.graph.message import add_messages
 
+# 跨轮携带的对话历史上限：窗口固定，prompt 长度/成本不随对话轮数线性增长
+MAX_HISTORY = 12
+
+
+def trim_history(messages: list | None, max_history: int = MAX_HISTORY) -> list:
+    """保留最近 max_history 条消息；首条若是 SystemMessage（置顶/摘要）则始终保留"""
+    messages = messages or []
+    if len(messages) <= max_history:
+        return messages
+    if isinstance(messages[0], SystemMessage):
+        return [messages[0], *messages[-(max_history - 1):]]
+    return messages[-max_history:]
+
 
 class UserIntent(BaseModel):
-    """用户意图识别结果"""
+    """用户意图识别结果（只读：需要改写时用 model_copy(update=...)）"""
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     intent_type: Literal["clothing_advice", "trip_planning", "general_qa", "general_chat", "unknown"] = Field(
         description="识别出的意图类型"
     )
@@ -16,7 +34,9 @@ class UserIntent(BaseModel):
 
 
 class WeatherInfo(BaseModel):
-    """天气信息"""
+    """天气信息（只读）"""
+    model_config = ConfigDict(frozen=True, extra="ignore")
+
     city: str = ""
     temperature: float = 0.0
     weather: str = ""  # 晴/多云/雨...
@@ -27,7 +47,9 @@ class WeatherInfo(BaseModel):
 
 
 class TripDay(BaseModel):
-    """单日行程"""
+    """单日行程（节点会原地补充 activities/risk_level/backup_plan，赋值不重复校验）"""
+    model_config = ConfigDict(extra="ignore", validate_assignment=False)
+
     date: str = ""
     city: str = ""
     activities: list[dict] = Field(default_factory=list)
@@ -38,64 +60,108 @@ class TripDay(BaseModel):
 
 class TripPlan(BaseModel):
     """完整行程规划"""
+    model_config = ConfigDict(extra="ignore", validate_assignment=False)
+
     title: str = ""
     days: list[TripDay] = Field(default_factory=list)
     total_budget_estimate: str = ""
     tips: list[str] = Field(default_factory=list)
 
 
-class GraphState(BaseModel):
+class GraphState(TypedDict, total=False):
     """
     LangGraph 主状态 - 贯穿整个工作流的上下文
 
-    使用 Pydantic v2 以获得更好的类型检查和序列化
+    用 TypedDict：节点之间直接传 dict，不再每步做 pydantic 校验/拷贝；
+    只有跨 LLM 边界的结构（意图/天气/行程）保留 pydantic 模型
+    字段可能缺省（total=False），读取一律用 state.get(key)
     """
     # 对话历史 (使用 LangGraph 的消息累加器)
-    messages: Annotated[list, add_messages] = Field(default_factory=list)
+    messages: Annotated[list, add_messages]
 
     # 当前用户输入
-    user_input: str = ""
+    user_input: str
+    # 小写化的用户输入（rewrite_and_route 算一次，下游节点复用）
+    user_input_lower: str
 
     # ===== rewrite / 澄清相关 =====
-    rewritten_query: str = ""
-    rewrite_slots: dict = Field(default_factory=dict)
-    duration_days_is_default: bool = False
+    rewritten_query: str
+    rewrite_slots: dict
+    duration_days_is_default: bool
 
-    need_clarification: bool = False
-    clarifying_questions: list[str] = Field(default_factory=list)
+    need_clarification: bool
+    clarifying_questions: list[str]
 
     # 是否本轮仅做澄清提问（缺城市时 True：直接输出问题，不继续规划）
-    clarify_only: bool = False
+    clarify_only: bool
 
     # 意图识别结果
-    intent: UserIntent | None = None
+    intent: UserIntent | None
 
     # 抽取的关键实体
-    entities: dict = Field(default_factory=dict)
+    entities: dict
     # 示例: {"cities": ["北京", "上海"], "dates": ["2024-01-20", "2024-01-22"], "preferences": ["安静", "咖啡"]}
 
     # 用户排除的景点（跨轮继承）
-    excluded_places: list[str] = Field(default_factory=list)
+    excluded_places: list[str]
 
     # 用户想去的景点（跨轮继承，优先级高于排除）
-    included_places: list[str] = Field(default_factory=list)
+    included_places: list[str]
 
     # 天气数据缓存
-    weather_data: dict[str, WeatherInfo | list[WeatherInfo]] = Field(default_factory=dict)  # city -> WeatherInfo 或 多日预报列表
+    weather_data: dict[str, WeatherInfo | list[WeatherInfo]]  # city -> WeatherInfo 或 多日预报列表
 
     # 用户画像 (从记忆系统加载)
-    user_profile: dict = Field(default_factory=dict)
+    user_profile: dict
+    # 上次加载画像时的查询摘要（跨轮继承；未变化则 load_memory 直接复用 user_profile）
+    last_memory_query_hash: str
+    # 上一轮后台记忆写入的 id（跨轮继承；写入未完成时 load_memory 不复用画像）
+    memory_write_id: str
 
     # 行程规划结果
-    trip_plan: TripPlan | None = None
+    trip_plan: TripPlan | None
 
     # 穿搭建议
-    clothing_advice: str = ""
+    clothing_advice: str
 
     # 最终输出
-    final_response: str = ""
+    final_response: str
 
     # 流程控制
-    current_node: str = ""
-    needs_replan: bool = False
-    error_message: str = ""
+    current_node: str
+    needs_replan: bool
+    error_message: str
+
+
+# 每轮重置字段（CLI 与 HTTP 服务共用）；其余字段（messages/entities/user_profile/weather_data/trip_plan/
+# excluded/included）直接沿用上一轮。只读常量，模块加载时构建一次
+# 注意：其中的空容器被各轮共享，节点只能返回新值，不要原地修改 state 里的这些字段
+_RESET_FIELDS: Mapping[str, Any] = MappingProxyType(dict(
+    user_input_lower="",
+    rewritten_query="",
+    rewrite_slots={},
+    duration_days_is_default=False,
+    need_clarification=False,
+    clarifying_questions=[],
+    clarify_only=False,
+    intent=None,
+    clothing_advice="",
+    final_response="",
+    current_node="",
+    needs_replan=False,
+    error_message="",
+))
+
+
+def build_initial_state(user_input: str, last_state: Mapping[str, Any] | None) -> GraphState:
+    """
+    上一轮 state + 重置字段 + 本轮输入 -> 本轮初始 state（对话历史截断到最近 MAX_HISTORY 条）
+    GraphState 是 TypedDict：直接合并成一个 dict，不做任何校验/拷贝
+    """
+    last_state = last_state or {}
+    return {
+        **last_state,
+        **_RESET_FIELDS,
+        "messages": trim_history(last_state.get("messages")),
+        "user_input": user_input,
+    }
@@ -4,18 +4,30 @@ IntelliGo CLI 入口
 """
 import sys
 import os
-from rich.console import Console
+
+import orjson
+from rich.console import Console, Group
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.prompt import Prompt
+from rich.syntax import Syntax
+from rich.table import Table
+from rich.text import Text
 
 from config import config
+from graph import nodes
 from graph.builder import get_compiled_graph
-from graph.state import GraphState
+from graph.state import GraphState, build_initial_state
+from utils.aio import run_sync
 
 from memory.vector_store import UserMemory
 console = Console()
 
+# 调试面板的静态部分：模块加载时构建一次，每次 /state 只填动态行（不再走 Markdown 解析）
+STATE_HEADER = Text("当前会话状态（state）", style="bold")
+PROFILE_HEADER = Text("用户画像（user_profile）", style="bold")
+STATE_FIELDS = (("意图", None), ("城市", "cities"), ("天数", "duration_days"), ("日期", "dates"), ("偏好", "preferences"))
+
 
 def print_banner():
     """打印欢迎横幅"""
@@ -49,6 +61,23 @@ def validate_config():
     console.print("✅ 配置验证通过\n", style="green")
 
 
+async def _astream_final_state(graph, initial_state: GraphState):
+    """
+    驱动图执行（含 async 节点）
+    - 非 debug：只要最终 state，ainvoke 一次返回，不为每个节点产出一份完整 state 快照
+    - debug：按 values 流式执行，打印节点流转
+    """
+    if not config.debug:
+        return await graph.ainvoke(initial_state)
+
+    final_state = None
+    async for event in graph.astream(initial_state, stream_mode="values"):
+        final_state = event
+        if event.get("current_node"):
+            console.print(f"[dim]  → {event['current_node']}[/dim]")
+    return final_state
+
+
 def run_cli():
     """运行 CLI 交互循环"""
     print_banner()
@@ -75,6 +104,7 @@ def run_cli():
             user_input = Prompt.ask("\n[bold blue]你[/bold blue]")
 
             if user_input.lower() in ["quit", "exit", "q", "退出"]:
+                run_sync(nodes.flush_memory_writes())  # 等后台记忆写入完成再退出
                 console.print("\n👋 再见！祝您旅途愉快！", style="cyan")
                 break
 
@@ -92,15 +122,13 @@ def run_cli():
                 intent = last_state.get("intent")
                 entities = last_state.get("entities") or {}
 
-                md = "\n".join([
-                    "## 当前会话状态（state）",
-                    f"- 意图: {getattr(intent, 'intent_type', None)}",
-                    f"- 城市: {entities.get('cities')}",
-                    f"- 天数: {entities.get('duration_days')}",
-                    f"- 日期: {entities.get('dates')}",
-                    f"- 偏好: {entities.get('preferences')}",
-                ])
-                console.print(Panel(Markdown(md), title="[bold green]Debug[/bold green]", border_style="green"))
+                table = Table(show_header=False, box=None, pad_edge=False)
+                table.add_column(style="cyan", no_wrap=True)
+                table.add_column()
+                for label, key in STATE_FIELDS:
+                    value = getattr(intent, "intent_type", None) if key is None else entities.get(key)
+                    table.add_row(label, str(value))
+                console.print(Panel(Group(STATE_HEADER, table), title="[bold green]Debug[/bold green]", border_style="green"))
                 continue
 
             if cmd in ["/profile", "profile"]:
@@ -112,19 +140,27 @@ def run_cli():
                 profile = up.get("profile")
                 rel = up.get("relevant_memories") or []
 
-                lines = ["## 用户画像（user_profile）", "### Profile"]
-                lines.append(f"```json\n{profile}\n```" if profile is not None else "- (empty)")
+                # orjson 输出合法 JSON（原先是 dict 的 repr），直接按 JSON 高亮，不经 Markdown 代码块
+                if profile is not None:
+                    json_blob = orjson.dumps(profile, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS).decode()
+                    profile_view = Syntax(json_blob, "json", word_wrap=True)
+                else:
+                    profile_view = Text("- (empty)")
 
-                lines.append("\n### Relevant memories (top-k)")
                 if not rel:
-                    lines.append("- (empty)")
+                    rel_md = "- (empty)"
                 else:
-                    for m in rel:
-                        lines.append(
-                            f"- **{m.get('category','unknown')}** / {m.get('type','unknown')} / score={m.get('score')}: {m.get('content')}"
-                        )
+                    rel_md = "\n".join(
+                        f"- **{m.get('category','unknown')}** / {m.get('type','unknown')} / score={m.get('score')}: {m.get('content')}"
+                        for m in rel
+                    )
 
-                console.print(Panel(Markdown("\n".join(lines)), title="[bold green]Profile[/bold green]", border_style="green"))
+                console.print(Panel(
+                    Group(PROFILE_HEADER, Text("Profile", style="bold"), profile_view,
+                          Text("\nRelevant memories (top-k)", style="bold"), Markdown(rel_md)),
+                    title="[bold green]Profile[/bold green]",
+                    border_style="green",
+                ))
                 continue
 
             if cmd.startswith("/clear"):
@@ -139,11 +175,11 @@ def run_cli():
                     console.print("[red]口令错误：未执行清空。[/red]")
                     continue
 
+                run_sync(nodes.flush_memory_writes())  # 先等后台写入，避免清空后又写回
                 UserMemory.clear_all_persisted_data()
 
-                # 重置 graph/nodes.py 中的全局 user_memory 实例
-                from graph import nodes
-                nodes.user_memory.reset()
+                # 重置 graph/nodes.py 中的全局记忆实例
+                nodes.get_user_memory().reset()
 
                 last_state = None  # 同时重置 CLI 的对话状态
                 console.print("[green]✅ 已清空全部用户画像/记忆（Chroma），并重置当前会话。[/green]")
@@ -155,38 +191,13 @@ def run_cli():
             # ====== 可视化命令结束 ======
 
 
-            # ✅ 构建初始状态：继承上一轮的部分字段 + 重置本轮字段
-            carry = {}
-            if last_state:
-                for k in ["messages", "entities", "user_profile", "weather_data", "trip_plan", "excluded_places", "included_places"]:
-                    v = last_state.get(k)
-                    if v is not None:
-                        carry[k] = v
-
-            reset = dict(
-                rewritten_query="",
-                rewrite_slots={},
-                need_clarification=False,
-                clarifying_questions=[],
-                clarify_only=False,
-                intent=None,
-                clothing_advice="",
-                final_response="",
-                current_node="",
-                needs_replan=False,
-                error_message="",
-            )
-
-            initial_state = GraphState(**carry, **reset, user_input=user_input)
+            # ✅ 构建初始状态：继承上一轮的字段 + 重置本轮字段（与 HTTP 服务共用同一实现，只做一次浅合并）
+            initial_state = build_initial_state(user_input, last_state)
 
             # 运行图
             console.print("\n[dim]🔄 思考中...[/dim]")
 
-            final_state = None
-            for event in graph.stream(initial_state, stream_mode="values"):
-                final_state = event
-                if config.debug and event.get("current_node"):
-                    console.print(f"[dim]  → {event['current_node']}[/dim]")
+            final_state = run_sync(_astream_final_state(graph, initial_state))
 
             # 输出结果
             if final_state and final_state.get("final_response"):
@@ -218,6 +229,7 @@ def run_cli():
             last_state = final_state
 
         except KeyboardInterrupt:
+            run_sync(nodes.flush_memory_writes())
             console.print("\n\n👋 再见！", style="cyan")
             break
         except Exception as e:
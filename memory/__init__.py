@@ -1,11 +1,18 @@
 """
 记忆系统 - 向量存储与实体抽取
+
+导出按需加载：避免 import memory 子模块时连带加载 Chroma / 抽取 LLM
 """
-from memory.vector_store import UserMemory
-from memory.entity_extractor import entity_extractor, EntityExtractor
+from utils.lazy import lazy_getattr
 
 __all__ = [
     "UserMemory",
     "entity_extractor",
     "EntityExtractor",
 ]
+
+__getattr__ = lazy_getattr(__name__, {
+    "UserMemory": "memory.vector_store",
+    "entity_extractor": "memory.entity_extractor",
+    "EntityExtractor": "memory.entity_extractor",
+})
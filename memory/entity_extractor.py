@@ -61,6 +61,10 @@ class EntityExtractor:
         """从对话中抽取偏好"""
         return self.chain.invoke({"conversation": conversation})
 
+    async def aextract(self, conversation: str) -> ExtractedPreferences:
+        """extract 的异步版本"""
+        return await self.chain.ainvoke({"conversation": conversation})
+
 
 # 单例
 entity_extractor = EntityExtractor()
@@ -1,42 +1,257 @@
 """
 基于 Chroma 的用户记忆系统
 """
+import asyncio
 import os
+import re
+import threading
+import uuid
 from datetime import datetime
 from difflib import SequenceMatcher
+from functools import lru_cache
+
+import chromadb
+from chromadb.config import Settings
+import numpy as np
 from langchain_chroma import Chroma
-from langchain_core.documents import Document
 from config import config
 from utils.llm import get_embeddings  # ⭐ 使用统一的 embedding 获取函数
-import shutil
-
-
-def _text_similarity(a: str, b: str) -> float:
-    """计算两段文本的相似度 (0~1)"""
-    return SequenceMatcher(None, a.strip().lower(), b.strip().lower()).ratio()
+from utils.cache import LRUCache, SemanticCache
+
+try:
+    from rapidfuzz import fuzz, process
+except ImportError:  # 未安装 rapidfuzz 时退回 difflib（纯 Python，较慢）
+    fuzz = process = None
+
+
+def _is_text_duplicate(text: str, others: list[str], threshold: float) -> bool:
+    """text 与 others 中任一条的文本相似度 (0~1) 是否 >= threshold；others 需已 strip().lower()"""
+    if not others:
+        return False
+    text = text.strip().lower()
+    if process is not None:
+        # C++ 实现，一次调用扫完全部候选；score_cutoff 让它按长度上界提前跳过不可能达标的候选
+        return process.extractOne(text, others, scorer=fuzz.ratio, score_cutoff=threshold * 100) is not None
+    la = len(text)
+    for o in others:
+        lb = len(o)
+        # ratio = 2M / (la + lb) <= 2·min / (la + lb)：长度差太大的直接跳过，不做 O(la·lb) 匹配
+        if not la or not lb or 2 * min(la, lb) / (la + lb) < threshold:
+            continue
+        # autojunk 的"高频字符"启发式对中文短文本没有意义，只会拖慢
+        if SequenceMatcher(None, text, o, autojunk=False).ratio() >= threshold:
+            return True
+    return False
+
+
+def _as_matrix(vecs) -> np.ndarray:
+    """embedding 列表 -> 行归一化的 float32 矩阵（点积即余弦相似度）"""
+    m = np.asarray(vecs, dtype=np.float32)
+    if m.ndim != 2 or not len(m):
+        return np.zeros((0, 0), dtype=np.float32)
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    return m / np.maximum(norms, 1e-12)
+
+
+def _greedy_dedup(emb: np.ndarray, threshold: float) -> list[int]:
+    """
+    贪心去重：按原顺序保留，与任一已保留条目余弦相似度 >= threshold 的丢弃
+    一次 E @ E.T 算出全部两两相似度，循环里只剩布尔运算
+    """
+    n = len(emb)
+    if not n:
+        return []
+    sims = emb @ emb.T
+    dropped = np.zeros(n, dtype=bool)
+    keep = []
+    for i in range(n):
+        if dropped[i]:
+            continue
+        keep.append(i)
+        dropped |= sims[i] >= threshold
+    return keep
+
+
+# 画像卡片类别映射（按顺序匹配：一条偏好只归入第一个命中的卡片）
+CARD_CONFIG = [
+    {
+        "id": "travel_habits",
+        "title": "出行习惯",
+        "icon": "🚶",
+        "categories": ["travel_style", "activity", "style"],
+        "keywords": ["习惯", "喜欢", "偏好", "节奏", "方式"]
+    },
+    {
+        "id": "favorite_places",
+        "title": "喜欢去的地方",
+        "icon": "📍",
+        "categories": ["place", "destination", "location", "spot"],
+        "keywords": ["景点", "地方", "去", "博物馆", "美术馆", "咖啡", "公园"]
+    },
+    {
+        "id": "dislikes",
+        "title": "不喜欢/需要避免",
+        "icon": "⚠️",
+        "categories": ["dislike", "avoid", "restriction"],
+        "keywords": ["不喜欢", "不想", "避免", "不要", "讨厌", "膝盖", "不适"]
+    },
+    {
+        "id": "budget",
+        "title": "预算与消费",
+        "icon": "💰",
+        "categories": ["budget", "price", "cost"],
+        "keywords": ["预算", "性价比", "便宜", "贵", "消费", "花费", "元", "块"]
+    },
+    {
+        "id": "food",
+        "title": "饮食偏好",
+        "icon": "🍜",
+        "categories": ["dining", "food", "cuisine", "restaurant"],
+        "keywords": ["吃", "餐", "美食", "口味", "辣", "甜", "素", "海鲜"]
+    },
+    {
+        "id": "accommodation",
+        "title": "住宿/交通偏好",
+        "icon": "🏨",
+        "categories": ["accommodation", "hotel", "transport", "traffic"],
+        "keywords": ["住", "酒店", "民宿", "交通", "高铁", "飞机", "自驾"]
+    }
+]
+
+# 每张卡片预编译两个正则：类别（匹配 metadata.category）/ 关键词（匹配偏好内容），模块加载时编译一次
+_CARD_PATTERNS = [
+    (
+        re.compile("|".join(map(re.escape, card["categories"]))),
+        re.compile("|".join(map(re.escape, card["keywords"]))),
+    )
+    for card in CARD_CONFIG
+]
+
+
+def _match_card(content_lower: str, category_lower: str) -> int | None:
+    """返回第一个命中的卡片下标（类别匹配 或 关键词匹配），都不命中返回 None"""
+    for i, (cat_rx, kw_rx) in enumerate(_CARD_PATTERNS):
+        if cat_rx.search(category_lower) or kw_rx.search(content_lower):
+            return i
+    return None
+
+
+@lru_cache(maxsize=1)
+def _get_client() -> "chromadb.ClientAPI":
+    """
+    进程内共享的 Chroma 持久化客户端（单例）
+    sqlite 元数据库 / HNSW 索引只打开一次，各用户、reset 前后都复用，只切换 collection 句柄
+    """
+    os.makedirs(config.chroma_persist_dir, exist_ok=True)
+    # allow_reset：clear_all_persisted_data 通过 client.reset() 清空，而不是删目录
+    return chromadb.PersistentClient(path=config.chroma_persist_dir, settings=Settings(allow_reset=True))
 
 
 class UserMemory:
     """用户记忆管理器"""
 
+    # 写缓冲达到该条数时自动落盘（否则等 flush() / 下一次读取）
+    write_batch_size = 256
+
     def __init__(self, user_id: str = "default_user"):
         self.user_id = user_id
 
-        # 确保目录存在
-        os.makedirs(config.chroma_persist_dir, exist_ok=True)
-
         # ⭐ 使用统一封装的 embeddings
         self.embeddings = get_embeddings()
 
-        # 初始化 Chroma
-        self.vectorstore = Chroma(
-            collection_name=f"{config.chroma_collection_name}_{user_id}",
+        # 初始化 Chroma（共享进程内客户端）
+        self.vectorstore = self._open_vectorstore()
+
+        # 读缓存（TTL LRU）：key 带版本号，写入即失效
+        # _version：任意写入递增（影响 search_relevant）；_pref_version：偏好写入递增（影响画像）
+        self._cache = LRUCache(maxsize=1024, ttl_seconds=60)
+        # 查询语义缓存：近似重复的查询（余弦 >= 0.95）直接复用检索结果，namespace 带版本号
+        self._qcache = SemanticCache(maxsize=128, threshold=0.95)
+        self._version = 0
+        self._pref_version = 0
+
+        # 写缓冲：去重后的记录先攒在内存，flush() 时一次 collection.add 写入（读取前自动 flush）
+        self._buf_lock = threading.RLock()
+        self._buf_texts: list[str] = []
+        self._buf_metas: list[dict] = []
+        self._buf_vecs: list = []
+        self._buf_pref_vecs: list = []  # 缓冲中的偏好向量（后续写入去重时也要比较）
+
+    def _open_vectorstore(self) -> Chroma:
+        return Chroma(
+            client=_get_client(),
+            collection_name=f"{config.chroma_collection_name}_{self.user_id}",
             embedding_function=self.embeddings,
-            persist_directory=config.chroma_persist_dir
         )
 
+    @property
+    def pref_version(self) -> int:
+        """偏好版本号：偏好写入/重置时递增，调用方可据此判断画像是否可能变化（缓冲中有偏好也算变化）"""
+        return self._pref_version + (1 if self._buf_pref_vecs else 0)
+
+    def _bump(self, preference: bool = False) -> None:
+        self._version += 1
+        if preference:
+            self._pref_version += 1
+
+    def _pref_snapshot(self) -> dict:
+        """
+        全部偏好（文本 + 元数据 + 归一化 embedding 矩阵），按偏好版本缓存
+        向量库里本就存着每条偏好的 embedding，去重直接复用，不再逐对比较文本
+        """
+        self.flush()
+        key = ("prefs", self._pref_version)
+        snap = self._cache.get(key)
+        if snap is None:
+            data = self.vectorstore.get(
+                where={"type": "preference"},
+                include=["embeddings", "documents", "metadatas"],
+            ) or {}
+            docs = list(data.get("documents") or [])
+            metas = list(data.get("metadatas") or [{}] * len(docs))
+            embs = data.get("embeddings")
+            snap = {
+                "documents": docs,
+                "metadatas": [m or {} for m in metas],
+                "emb": _as_matrix(embs if embs is not None and len(embs) else []),
+            }
+            self._cache.set(key, snap)
+        return snap
+
+    def _nearest_pref_similarity(self, vec) -> float:
+        """已有偏好中与 vec 最相近的一条的余弦相似度（HNSW top-1；无偏好时返回 -1）"""
+        hits = self.vectorstore.similarity_search_by_vector_with_relevance_scores(
+            [float(x) for x in vec], k=1, filter={"type": "preference"}
+        )
+        if not hits:
+            return -1.0
+        # 默认 l2 空间返回平方距离；向量已归一化：d = 2 - 2cos
+        return 1.0 - hits[0][1] / 2
+
+    def _add_with_vectors(self, texts: list[str], metadatas: list[dict], vecs) -> None:
+        """带预计算向量写入，避免 Chroma 再 embed 一遍"""
+        self.vectorstore._collection.add(
+            ids=[str(uuid.uuid4()) for _ in texts],
+            embeddings=[list(map(float, v)) for v in vecs],
+            documents=texts,
+            metadatas=metadatas,
+        )
+
+    def flush(self) -> None:
+        """把写缓冲中的记录一次性写入向量库（无缓冲时直接返回）"""
+        with self._buf_lock:
+            if not self._buf_texts:
+                return
+            has_pref = bool(self._buf_pref_vecs)
+            self._add_with_vectors(self._buf_texts, self._buf_metas, self._buf_vecs)
+            self._discard_buffer()
+            self._bump(preference=has_pref)
+
+    def _discard_buffer(self) -> None:
+        self._buf_texts, self._buf_metas, self._buf_vecs, self._buf_pref_vecs = [], [], [], []
+
     def add_preference(self, content: str, category: str, source: str = "conversation",
-                       similarity_threshold: float = 0.75):
+                       similarity_threshold: float = 0.9):
         """
         添加用户偏好（自动去重：已存在相似内容则跳过）
 
@@ -44,42 +259,121 @@ class UserMemory:
             content: 偏好内容，如 "喜欢安静的咖啡厅"
             category: 类别，如 "dining", "activity", "travel_style"
             source: 来源
-            similarity_threshold: 文本相似度阈值，超过则视为重复不添加
+            similarity_threshold: embedding 余弦相似度阈值，超过则视为重复不添加
         """
-        content = content.strip()
-        if not content:
-            return
-
-        # 检查是否已存在相似内容
-        existing = self.vectorstore.get(where={"type": "preference"})
-        if existing and existing.get("documents"):
-            for doc_content in existing["documents"]:
-                if _text_similarity(content, doc_content) >= similarity_threshold:
-                    return  # 已存在相似内容，跳过
-
-        doc = Document(
-            page_content=content,
-            metadata={
-                "user_id": self.user_id,
-                "category": category,
-                "source": source,
-                "timestamp": datetime.now().isoformat(),
-                "type": "preference"
-            }
+        self.add_many(
+            [{"content": content, "category": category, "source": source}],
+            similarity_threshold=similarity_threshold,
         )
-        self.vectorstore.add_documents([doc])
 
-    def add_memory(self, content: str, memory_type: str = "interaction"):
-        """添加交互记忆"""
-        doc = Document(
-            page_content=content,
-            metadata={
-                "user_id": self.user_id,
-                "type": memory_type,
-                "timestamp": datetime.now().isoformat()
-            }
+    def add_preferences(self, items: list[tuple[str, str]], source: str = "conversation",
+                        similarity_threshold: float = 0.9):
+        """
+        批量添加偏好：去重规则同 add_preference，整批只做一次 embedding
+
+        Args:
+            items: [(content, category), ...]
+        """
+        self.add_many(
+            [{"content": c, "category": cat, "source": source} for c, cat in items],
+            similarity_threshold=similarity_threshold,
         )
-        self.vectorstore.add_documents([doc])
+
+    def add_many(self, entries: list[dict], similarity_threshold: float = 0.9):
+        """
+        批量写入记忆：一次 embed_documents + 一次写入
+
+        Args:
+            entries: [{"content": "...", "type": "preference", "category": "...", "source": "..."}, ...]
+                     type 缺省为 "preference"；偏好类按 embedding 余弦相似度去重（含批内去重）
+            similarity_threshold: 偏好去重的余弦相似度阈值
+        """
+        items = self._batch_items(entries)
+        if items:
+            vecs = self.embeddings.embed_documents([c for c, _ in items])
+            self._write_batch(items, vecs, similarity_threshold)
+
+    async def aadd_many(self, entries: list[dict], similarity_threshold: float = 0.9):
+        """add_many 的异步版本：aembed_documents 一次算完整批，去重 + 写入放到线程池"""
+        items = self._batch_items(entries)
+        if items:
+            vecs = await self.embeddings.aembed_documents([c for c, _ in items])
+            await asyncio.to_thread(self._write_batch, items, vecs, similarity_threshold)
+
+    async def add_preferences_async(self, items: list[tuple[str, str]], source: str = "conversation",
+                                    similarity_threshold: float = 0.9):
+        """add_preferences 的异步版本"""
+        await self.aadd_many(
+            [{"content": c, "category": cat, "source": source} for c, cat in items],
+            similarity_threshold=similarity_threshold,
+        )
+
+    @staticmethod
+    def _batch_items(entries: list[dict]) -> list[tuple[str, dict]]:
+        items = []
+        for e in entries:
+            content = str(e.get("content") or "").strip()
+            if content:
+                items.append((content, e))
+        return items
+
+    def _write_batch(self, items: list[tuple[str, dict]], vecs, similarity_threshold: float) -> None:
+        """已算好向量的一批记忆：偏好去重后放入写缓冲，攒够 write_batch_size 条再落盘"""
+        with self._buf_lock:
+            self._buffer_batch(items, vecs, similarity_threshold)
+            if len(self._buf_texts) >= self.write_batch_size:
+                self.flush()
+
+    def _buffer_batch(self, items: list[tuple[str, dict]], vecs, similarity_threshold: float) -> None:
+        """偏好去重（已落盘的 + 缓冲中的 + 本批已接受的），通过的记录追加到写缓冲（需持 _buf_lock）"""
+        vecs = _as_matrix(vecs)
+        now = datetime.now().isoformat()
+
+        # 已缓存的偏好矩阵（当前版本的完整快照）：整批一次矩阵乘法比较；未缓存时不拉全量，逐条走向量库 top-1
+        snap = self._cache.get(("prefs", self._pref_version))
+        dup_existing = None
+        if snap is not None:
+            existing = snap["emb"]
+            if len(existing):
+                dup_existing = (vecs @ existing.T).max(axis=1) >= similarity_threshold
+            else:
+                dup_existing = np.zeros(len(vecs), dtype=bool)
+        kept_pref_vecs = self._buf_pref_vecs
+
+        for i, ((content, e), v) in enumerate(zip(items, vecs)):
+            memory_type = e.get("type") or "preference"
+
+            if memory_type == "preference":
+                # 与已落盘的偏好 / 缓冲中及本批已接受的偏好比较
+                if dup_existing is not None:
+                    if dup_existing[i]:
+                        continue
+                elif self._nearest_pref_similarity(v) >= similarity_threshold:
+                    continue
+                if kept_pref_vecs and float(np.max(np.stack(kept_pref_vecs) @ v)) >= similarity_threshold:
+                    continue
+                kept_pref_vecs.append(v)
+                metadata = {
+                    "user_id": self.user_id,
+                    "category": str(e.get("category") or "general"),
+                    "source": str(e.get("source") or "conversation"),
+                    "timestamp": now,
+                    "type": "preference",
+                }
+            else:
+                metadata = {
+                    "user_id": self.user_id,
+                    "type": memory_type,
+                    "timestamp": now,
+                }
+
+            self._buf_texts.append(content)
+            self._buf_metas.append(metadata)
+            self._buf_vecs.append(v)
+
+    def add_memory(self, content: str, memory_type: str = "interaction"):
+        """添加交互记忆（与批量写入同一路径：向量走 embedding 缓存，带向量写入）"""
+        self.add_many([{"content": content, "type": memory_type}])
 
     def search_relevant(self, query: str, k: int = 5,
                          min_score: float = 0.3,
@@ -96,8 +390,21 @@ class UserMemory:
         Returns:
             [{"content": "...", "category": "...", "score": 0.85}, ...]
         """
-        # 多取一些候选，后续去重可能会过滤掉部分
-        results = self.vectorstore.similarity_search_with_score(query, k=k * 2)
+        self.flush()
+        key = ("search", self._version, query.strip().lower(), k, min_score, dedup_threshold)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return [dict(m) for m in cached]
+
+        # 语义缓存：只算一次 query embedding，命中则不走向量检索
+        q = self.embeddings.embed_query(query)
+        namespace = (self._version, k, min_score, dedup_threshold)
+        hit = self._qcache.get(q, namespace=namespace)
+        if hit is not None:
+            return [dict(m) for m in hit]
+
+        # 多取一些候选，后续去重可能会过滤掉部分；直接用已算好的向量检索，不再重复 embed
+        results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(q, k=k * 2)
 
         selected = []
         selected_contents = []
@@ -112,13 +419,7 @@ class UserMemory:
             content = doc.page_content
 
             # 门槛2：与已选内容重复，跳过
-            is_duplicate = False
-            for existing in selected_contents:
-                if _text_similarity(content, existing) >= dedup_threshold:
-                    is_duplicate = True
-                    break
-
-            if is_duplicate:
+            if _is_text_duplicate(content, selected_contents, dedup_threshold):
                 continue
 
             selected.append({
@@ -127,58 +428,61 @@ class UserMemory:
                 "type": doc.metadata.get("type", "unknown"),
                 "score": sim_score
             })
-            selected_contents.append(content)
+            selected_contents.append(content.strip().lower())
 
             # 达到目标数量后停止
             if len(selected) >= k:
                 break
 
-        return selected
+        self._cache.set(key, selected)
+        self._qcache.set(q, selected, namespace=namespace)
+        # 缓存里的记录不外借：每次返回逐条拷贝，调用方修改结果不会污染缓存
+        return [dict(m) for m in selected]
 
-    def get_user_profile(self, dedup_threshold: float = 0.7) -> dict:
+    def get_user_profile(self, dedup_threshold: float = 0.9) -> dict:
         """
         获取用户画像摘要（自动去重）
 
         Args:
-            dedup_threshold: 去重阈值，相似度超过此值的只保留一条
+            dedup_threshold: 去重阈值（embedding 余弦相似度），超过此值的只保留一条
         """
-        # 获取所有偏好类记忆
-        all_docs = self.vectorstore.get(
-            where={"type": "preference"}
-        )
+        self.flush()
+        key = ("profile", self._pref_version, dedup_threshold)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        # 获取所有偏好类记忆（带 embedding）
+        snap = self._pref_snapshot()
 
         profile = {
             "preferences": [],
             "categories": {}
         }
 
-        if all_docs and all_docs.get("documents"):
-            seen_contents = []  # 用于去重
+        for i in _greedy_dedup(snap["emb"], dedup_threshold):
+            content = snap["documents"][i]
+            category = snap["metadatas"][i].get("category", "general")
 
-            for i, content in enumerate(all_docs["documents"]):
-                # 检查是否与已添加内容重复
-                is_duplicate = False
-                for seen in seen_contents:
-                    if _text_similarity(content, seen) >= dedup_threshold:
-                        is_duplicate = True
-                        break
+            profile["preferences"].append(content)
 
-                if is_duplicate:
-                    continue
+            if category not in profile["categories"]:
+                profile["categories"][category] = []
+            profile["categories"][category].append(content)
 
-                seen_contents.append(content)
-                metadata = all_docs["metadatas"][i] if all_docs.get("metadatas") else {}
-                category = metadata.get("category", "general")
+        self._cache.set(key, profile)
+        return profile
 
-                profile["preferences"].append(content)
+    # ===== 异步包装：Chroma / 本地 embedding 都是阻塞调用，放到线程池执行，不占事件循环 =====
+    async def asearch_relevant(self, query: str, **kwargs) -> list[dict]:
+        """search_relevant 的异步版本（与其它 I/O 并发）"""
+        return await asyncio.to_thread(self.search_relevant, query, **kwargs)
 
-                if category not in profile["categories"]:
-                    profile["categories"][category] = []
-                profile["categories"][category].append(content)
+    async def aget_user_profile(self, **kwargs) -> dict:
+        """get_user_profile 的异步版本（与其它 I/O 并发）"""
+        return await asyncio.to_thread(self.get_user_profile, **kwargs)
 
-        return profile
-
-    def get_formatted_profile(self, dedup_threshold: float = 0.7) -> dict:
+    def get_formatted_profile(self, dedup_threshold: float = 0.9) -> dict:
         """
         获取格式化的用户画像（适合前端展示）
 
@@ -199,128 +503,52 @@ class UserMemory:
             "raw_count": 10  # 原始记录总数
         }
         """
-        # 定义卡片类别映射
-        CARD_CONFIG = [
-            {
-                "id": "travel_habits",
-                "title": "出行习惯",
-                "icon": "🚶",
-                "categories": ["travel_style", "activity", "style"],
-                "keywords": ["习惯", "喜欢", "偏好", "节奏", "方式"]
-            },
-            {
-                "id": "favorite_places",
-                "title": "喜欢去的地方",
-                "icon": "📍",
-                "categories": ["place", "destination", "location", "spot"],
-                "keywords": ["景点", "地方", "去", "博物馆", "美术馆", "咖啡", "公园"]
-            },
-            {
-                "id": "dislikes",
-                "title": "不喜欢/需要避免",
-                "icon": "⚠️",
-                "categories": ["dislike", "avoid", "restriction"],
-                "keywords": ["不喜欢", "不想", "避免", "不要", "讨厌", "膝盖", "不适"]
-            },
-            {
-                "id": "budget",
-                "title": "预算与消费",
-                "icon": "💰",
-                "categories": ["budget", "price", "cost"],
-                "keywords": ["预算", "性价比", "便宜", "贵", "消费", "花费", "元", "块"]
-            },
-            {
-                "id": "food",
-                "title": "饮食偏好",
-                "icon": "🍜",
-                "categories": ["dining", "food", "cuisine", "restaurant"],
-                "keywords": ["吃", "餐", "美食", "口味", "辣", "甜", "素", "海鲜"]
-            },
-            {
-                "id": "accommodation",
-                "title": "住宿/交通偏好",
-                "icon": "🏨",
-                "categories": ["accommodation", "hotel", "transport", "traffic"],
-                "keywords": ["住", "酒店", "民宿", "交通", "高铁", "飞机", "自驾"]
-            }
-        ]
-
-        # 获取所有偏好记录（带元数据）
-        all_docs = self.vectorstore.get(where={"type": "preference"})
+        # 获取所有偏好记录（带元数据 + embedding）
+        snap = self._pref_snapshot()
 
         raw_records = []
-        if all_docs and all_docs.get("documents"):
-            for i, content in enumerate(all_docs["documents"]):
-                metadata = all_docs["metadatas"][i] if all_docs.get("metadatas") else {}
-                raw_records.append({
-                    "content": content,
-                    "category": metadata.get("category", "general"),
-                    "timestamp": metadata.get("timestamp", ""),
-                    "source": metadata.get("source", "unknown")
-                })
-
-        # 去重
-        seen_contents = []
-        unique_records = []
-        for rec in raw_records:
-            is_dup = False
-            for seen in seen_contents:
-                if _text_similarity(rec["content"], seen) >= dedup_threshold:
-                    is_dup = True
-                    break
-            if not is_dup:
-                seen_contents.append(rec["content"])
-                unique_records.append(rec)
-
-        # 分配到卡片
-        cards = []
-        used_indices = set()
-
-        for card_cfg in CARD_CONFIG:
-            items = []
-            for idx, rec in enumerate(unique_records):
-                if idx in used_indices:
-                    continue
+        for content, metadata in zip(snap["documents"], snap["metadatas"]):
+            category = metadata.get("category", "general")
+            raw_records.append({
+                "content": content,
+                "category": category,
+                "timestamp": metadata.get("timestamp", ""),
+                "source": metadata.get("source", "unknown"),
+                # 匹配用的小写形式只在这里算一次
+                "content_lower": content.lower(),
+                "category_lower": category.lower(),
+            })
+
+        # 去重（embedding 余弦相似度）
+        unique_records = [raw_records[i] for i in _greedy_dedup(snap["emb"], dedup_threshold)]
 
-                content_lower = rec["content"].lower()
-                category_lower = rec["category"].lower()
-
-                # 匹配规则：类别匹配 或 关键词匹配
-                matched = False
-
-                # 类别匹配
-                for cat in card_cfg["categories"]:
-                    if cat in category_lower:
-                        matched = True
-                        break
-
-                # 关键词匹配
-                if not matched:
-                    for kw in card_cfg["keywords"]:
-                        if kw in content_lower:
-                            matched = True
-                            break
-
-                if matched:
-                    items.append({
-                        "text": self._shorten_preference(rec["content"]),
-                        "source": {
-                            "original": rec["content"],
-                            "category": rec["category"],
-                            "timestamp": rec["timestamp"],
-                            "source_type": rec["source"]
-                        }
-                    })
-                    used_indices.add(idx)
-
-            # 只添加有内容的卡片
-            if items:
-                cards.append({
-                    "id": card_cfg["id"],
-                    "title": card_cfg["title"],
-                    "icon": card_cfg["icon"],
-                    "items": items
-                })
+        # 分配到卡片：每条记录只扫描一遍，归入第一个命中的卡片（卡片顺序、卡内记录顺序不变）
+        buckets = [[] for _ in CARD_CONFIG]
+        for rec in unique_records:
+            i = _match_card(rec["content_lower"], rec["category_lower"])
+            if i is None:
+                continue
+            buckets[i].append({
+                "text": self._shorten_preference(rec["content"]),
+                "source": {
+                    "original": rec["content"],
+                    "category": rec["category"],
+                    "timestamp": rec["timestamp"],
+                    "source_type": rec["source"]
+                }
+            })
+
+        # 只添加有内容的卡片
+        cards = [
+            {
+                "id": card_cfg["id"],
+                "title": card_cfg["title"],
+                "icon": card_cfg["icon"],
+                "items": items
+            }
+            for card_cfg, items in zip(CARD_CONFIG, buckets)
+            if items
+        ]
 
         # 生成一句话总结
         summary = self._generate_summary(cards)
@@ -374,45 +602,43 @@ class UserMemory:
 
     def reset(self):
         """
-        重置当前实例：删除 collection 中所有数据并重新初始化 vectorstore
+        重置当前实例：删除当前 collection 并在共享客户端上重建（不重开客户端）
         """
-        # 删除当前 collection 的所有数据
+        # 整个 collection 删掉，比逐个 id 删除快（目录已被清空时 collection 可能已不存在）
         try:
-            # 获取所有文档 ID 并删除
-            all_data = self.vectorstore.get()
-            if all_data and all_data.get("ids"):
-                self.vectorstore.delete(ids=all_data["ids"])
+            self.vectorstore.delete_collection()
         except Exception:
             pass
 
-        # 重新初始化 vectorstore
-        self.vectorstore = Chroma(
-            collection_name=f"{config.chroma_collection_name}_{self.user_id}",
-            embedding_function=self.embeddings,
-            persist_directory=config.chroma_persist_dir
-        )
+        # 重新打开 vectorstore；尚未落盘的缓冲一并丢弃
+        with self._buf_lock:
+            self._discard_buffer()
+        self.vectorstore = self._open_vectorstore()
+        self._cache.clear()
+        self._qcache.clear()
+        self._bump(preference=True)
 
     @staticmethod
     def clear_all_persisted_data():
         """
-        清空整个 Chroma 持久化目录（会删除所有 collection/所有用户数据）
+        清空 Chroma 全部持久化数据（会删除所有 collection/所有用户数据）
+        走客户端原生 reset：不删目录、不留失效的文件句柄，共享客户端继续可用
+        之后需对仍在使用的 UserMemory 实例调用 reset() 重新打开 collection 并清空其读缓存
         """
-        from config import config  # 避免循环 import 的话也可以放文件顶部
-
-        if os.path.isdir(config.chroma_persist_dir):
-            shutil.rmtree(config.chroma_persist_dir, ignore_errors=True)
-        os.makedirs(config.chroma_persist_dir, exist_ok=True)
+        _get_client().reset()
 
 
 # ---- 测试 ----
 if __name__ == "__main__":
     memory = UserMemory("test_user")
 
-    # 添加一些测试偏好
-    memory.add_preference("喜欢安静的咖啡厅", "dining")
-    memory.add_preference("不喜欢爬山，膝盖不好", "activity")
-    memory.add_preference("偏好文艺小众景点", "travel_style")
-    memory.add_preference("预算敏感，喜欢性价比高的选择", "budget")
+    # 添加一些测试偏好（一次 embedding）
+    memory.add_preferences([
+        ("喜欢安静的咖啡厅", "dining"),
+        ("不喜欢爬山，膝盖不好", "activity"),
+        ("偏好文艺小众景点", "travel_style"),
+        ("预算敏感，喜欢性价比高的选择", "budget"),
+    ])
 
     # 搜索测试
     print("🔍 搜索 '周末去哪玩' 相关记忆:")
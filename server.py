@@ -1,31 +1,83 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import os
+import re
+
+import orjson
+from contextlib import asynccontextmanager
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
-from core.assistant import run_one_turn, validate_config_or_raise
-from core.session_store import InMemorySessionStore
+from core.assistant import arun_one_turn, astream_one_turn, get_graph, validate_config_or_raise
+from core.session_store import InMemorySessionStore, RedisSessionStore
 from config import config
 from memory.vector_store import UserMemory
+from utils.cache import LRUCache
+from utils.llm import clear_llm_cache
+
+
+@lru_cache(maxsize=1)
+def _validate_once() -> None:
+    """配置进程内只校验一次（配置在启动后不会变）；校验失败不缓存，下次调用仍会抛错"""
+    validate_config_or_raise()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    接口均为 async：图（LLM/天气 HTTP）直接在服务的事件循环上执行，等待网络时不占线程
+    启动时校验一次配置（缺关键配置直接启动失败）；退出时等后台记忆写入落盘，并关闭天气查询的连接池
+    """
+    _validate_once()
+    yield
+    from graph import nodes
+    from tools.weather import weather_tool
+    await nodes.flush_memory_writes()
+    await weather_tool.aclose()
+    if isinstance(store, RedisSessionStore):
+        await store.aclose()
+
 
+# 所有 JSON 响应走 orjson 序列化
+app = FastAPI(title="IntelliGo API", version="0.1.0", lifespan=lifespan, default_response_class=ORJSONResponse)
+# 网页/画像/穿搭回复都是大段中文文本，压缩后体积小得多（小于 512 字节的响应不压缩）
+app.add_middleware(GZipMiddleware, minimum_size=512, compresslevel=5)
 
-app = FastAPI(title="IntelliGo API", version="0.1.0")
+# 会话存储：配置了 REDIS_URL 则所有 worker 共享 Redis，否则（个人使用）存在进程内存
+if config.redis_url:
+    store = RedisSessionStore(config.redis_url, ttl_seconds=60 * 60 * 24 * 7, on_reset=clear_llm_cache)
+else:
+    store = InMemorySessionStore(ttl_seconds=60 * 60 * 24 * 7, on_reset=clear_llm_cache)
 
-# 会话存储（个人使用先内存即可）
-store = InMemorySessionStore(ttl_seconds=60 * 60 * 24 * 7)
+# LLM 输出的 markdown 代码块（```json [...] ```）中的 JSON 数组
+_FENCE_RE = re.compile(r"```(?:json)?\s*(\[.*?\])\s*```", re.S)
+
+# 个性化问题建议缓存：画像摘要指纹 -> 3 个问题（1 小时过期；清空画像时整体清掉）
+_suggestions_cache = LRUCache(maxsize=1024, ttl_seconds=60 * 60)
+
+# 导入时即编译图：worker 启动时完成，首个请求不再承担编译开销（多 worker 时每个 worker 各编译一次）
+get_graph()
 
 
 class ChatRequest(BaseModel):
+    # 只读；多余字段忽略；首尾空白在校验时去掉（纯空白消息直接 422）
+    model_config = ConfigDict(extra="ignore", frozen=True, str_strip_whitespace=True)
+
     session_id: str = Field(min_length=1)
     message: str = Field(min_length=1)
 
 
 class ChatResponse(BaseModel):
+    model_config = ConfigDict(extra="ignore", frozen=True)
+
     session_id: str
     reply: str
     # 额外信息（可用于前端调试/展示）
@@ -36,95 +88,150 @@ class ChatResponse(BaseModel):
     entities: dict = Field(default_factory=dict)
 
 
+# 移动端网页启动时读入内存一次，请求时不再读盘
+with open(os.path.join(os.path.dirname(__file__), "web", "index.html"), "rb") as f:
+    _INDEX_HTML = f.read()
+
+
 @app.get("/", response_class=HTMLResponse)
-def index():
+async def index():
     """
     直接返回移动端网页
     """
-    web_path = os.path.join(os.path.dirname(__file__), "web", "index.html")
-    with open(web_path, "r", encoding="utf-8") as f:
-        return f.read()
+    return HTMLResponse(content=_INDEX_HTML)
 
 
 @app.get("/health")
-def health():
+async def health():
     """
     健康检查：也验证配置是否齐全
     """
     try:
-        validate_config_or_raise()
+        _validate_once()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     return {"ok": True}
 
 
-@app.post("/api/chat", response_model=ChatResponse)
-def chat(req: ChatRequest):
-    try:
-        validate_config_or_raise()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def _admin_command(req: ChatRequest) -> Optional[ChatResponse]:
+    """
+    管理员指令拦截：清空全部（Chroma + 当前会话）
+    不是管理员指令时返回 None；首尾空白已由 ChatRequest 校验时去掉，普通消息只做一次前缀判断
+    """
+    if not req.message.startswith("/purge_all"):
+        return None
 
-    # ===== 管理员指令拦截：清空全部（Chroma + 当前会话）=====
-    text = (req.message or "").strip()
-    if text.startswith("/purge_all"):
-        # 格式：/purge_all <token>
-        parts = text.split(maxsplit=1)
-        token = parts[1].strip() if len(parts) == 2 else ""
-
-        if not config.purge_token:
-            raise HTTPException(status_code=500, detail="PURGE_TOKEN 未设置，禁止清空操作。")
-
-        if token != config.purge_token:
-            return ChatResponse(
-                session_id=req.session_id,
-                reply="口令错误：未执行清空。",
-                current_node="admin_command",
-            )
-
-        # 1) 清空 Chroma 持久化数据
-        UserMemory.clear_all_persisted_data()
-        # 2) 重置 graph/nodes.py 中的全局 user_memory 实例
-        from graph import nodes
-        nodes.user_memory.reset()
-        # 3) 清空当前会话 state（避免还显示旧画像/旧状态）
-        store.reset(req.session_id)
+    # 格式：/purge_all <token>
+    parts = req.message.split(maxsplit=1)
+    token = parts[1].strip() if len(parts) == 2 else ""
 
+    if not config.purge_token:
+        raise HTTPException(status_code=500, detail="PURGE_TOKEN 未设置，禁止清空操作。")
+
+    if token != config.purge_token:
         return ChatResponse(
             session_id=req.session_id,
-            reply="已清空全部用户画像/记忆（Chroma 数据目录已清空），并重置当前会话。",
+            reply="口令错误：未执行清空。",
             current_node="admin_command",
         )
-    # ===== 拦截结束 =====
 
-    last_state = store.get(req.session_id)
-    final_state, reply = run_one_turn(req.message, last_state=last_state)
-    store.set(req.session_id, final_state)
+    # 1) 清空 Chroma 持久化数据（先等后台记忆写入落盘，避免清空后又写回）
+    from graph import nodes
+    await nodes.flush_memory_writes()
+    await asyncio.to_thread(UserMemory.clear_all_persisted_data)
+    # 2) 重置 graph/nodes.py 中的全局记忆实例
+    await asyncio.to_thread(nodes.get_user_memory().reset)
+    _suggestions_cache.clear()
+    # 3) 清空当前会话 state（避免还显示旧画像/旧状态）
+    await store.areset(req.session_id)
+
+    return ChatResponse(
+        session_id=req.session_id,
+        reply="已清空全部用户画像/记忆（Chroma 数据目录已清空），并重置当前会话。",
+        current_node="admin_command",
+    )
 
-    intent_type = ""
-    intent = final_state.get("intent")
+
+def _intent_type(intent: Any) -> str:
+    """state 里的 intent 可能是 dict（如从存储还原）或 UserIntent 模型，也可能为空"""
     if isinstance(intent, dict):
-        intent_type = intent.get("intent_type") or ""
-    else:
-        # 有些情况下可能是 Pydantic/BaseModel 或其他对象；尽量兼容
-        try:
-            intent_type = getattr(intent, "intent_type", "") or ""
-        except Exception:
-            intent_type = ""
+        return intent.get("intent_type") or ""
+    return getattr(intent, "intent_type", "") or ""
+
 
+def _chat_response(session_id: str, final_state: Dict[str, Any], reply: str) -> ChatResponse:
     return ChatResponse(
-        session_id=req.session_id,
+        session_id=session_id,
         reply=reply,
         current_node=final_state.get("current_node") or "",
         need_clarification=bool(final_state.get("need_clarification")),
         clarifying_questions=final_state.get("clarifying_questions") or [],
-        intent_type=intent_type,
+        intent_type=_intent_type(final_state.get("intent")),
         entities=final_state.get("entities") or {},
     )
 
 
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    try:
+        _validate_once()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    admin = await _admin_command(req)
+    if admin is not None:
+        return admin
+
+    last_state = await store.aget(req.session_id)
+    final_state, reply = await arun_one_turn(req.message, last_state=last_state)
+    await store.aset(req.session_id, final_state)
+
+    return _chat_response(req.session_id, final_state, reply)
+
+
+def _sse(event: str, data: Any) -> bytes:
+    """一条 SSE 消息（data 为 orjson 序列化的单行 JSON）"""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    流式对话（Server-Sent Events）：
+    - event: partial —— 节点推送的增量，如 {"node": "general_qa", "delta": "..."}、{"node": "clothing_advice", "day": 1, "block": "..."}
+      （day 从 1 开始，与“第N天”标题一致）
+    - event: final   —— 最后一条，内容同 /api/chat 的响应
+    管理员指令直接返回一条 final
+    """
+    try:
+        _validate_once()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    admin = await _admin_command(req)
+    last_state = None if admin is not None else await store.aget(req.session_id)
+
+    async def events():
+        if admin is not None:
+            yield _sse("final", admin.model_dump())
+            return
+        async for kind, payload in astream_one_turn(req.message, last_state=last_state):
+            if kind == "partial":
+                yield _sse("partial", payload)
+            else:
+                await store.aset(req.session_id, payload["state"])
+                yield _sse("final", _chat_response(req.session_id, payload["state"], payload["reply"]).model_dump())
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # 禁止中间代理缓冲，保证增量及时送达
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/api/profile")
-def profile(session_id: str):
+async def profile(session_id: str):
     """
     获取用户画像（格式化版本，适合前端展示）
 
@@ -149,11 +256,13 @@ def profile(session_id: str):
         "user_profile": {...}  # 原始数据（兼容旧版）
     }
     """
-    st = store.get(session_id) or {}
+    st = await store.aget(session_id) or {}
 
-    # 获取格式化画像（直接从 Chroma 读取，不依赖 session state）
-    user_memory = UserMemory()
-    formatted = user_memory.get_formatted_profile()
+    # 获取格式化画像（直接从 Chroma 读取，不依赖 session state；先等上一轮的后台写入完成）
+    from graph import nodes
+    await nodes.flush_memory_writes()
+    # 复用 graph.nodes 的记忆单例（Chroma 客户端/集合只打开一次）
+    formatted = await asyncio.to_thread(nodes.get_user_memory().get_formatted_profile)
 
     return {
         "session_id": session_id,
@@ -163,37 +272,42 @@ def profile(session_id: str):
 
 
 @app.post("/api/reset")
-def reset(session_id: str):
-    store.reset(session_id)
+async def reset(session_id: str):
+    await store.areset(session_id)
     return {"ok": True, "session_id": session_id}
 
 
 @app.post("/api/clear_profile")
-def clear_profile():
+async def clear_profile():
     """
     清空用户画像（一键清空，无需口令）
     """
-    # 1) 清空 Chroma 持久化数据
-    UserMemory.clear_all_persisted_data()
-    # 2) 重置 graph/nodes.py 中的全局 user_memory 实例
+    # 1) 清空 Chroma 持久化数据（先等后台记忆写入落盘，避免清空后又写回）
     from graph import nodes
-    nodes.user_memory.reset()
+    await nodes.flush_memory_writes()
+    await asyncio.to_thread(UserMemory.clear_all_persisted_data)
+    # 2) 重置 graph/nodes.py 中的全局记忆实例
+    await asyncio.to_thread(nodes.get_user_memory().reset)
+    _suggestions_cache.clear()
 
     return {"ok": True, "message": "用户画像已清空"}
 
 
 @app.get("/api/suggestions")
-def suggestions(session_id: str):
+async def suggestions(session_id: str):
     """
     根据用户画像生成个性化问题建议
     - 画像不为空：AI 生成 3 个个性化问题
     - 画像为空：返回空数组，前端使用 fallback
     """
-    user_memory = UserMemory()
-    formatted = user_memory.get_formatted_profile()
+    from graph import nodes
+    await nodes.flush_memory_writes()
+    # 复用 graph.nodes 的记忆单例（Chroma 客户端/集合只打开一次）
+    formatted = await asyncio.to_thread(nodes.get_user_memory().get_formatted_profile)
 
     # 如果画像为空，返回空数组让前端走 fallback
-    if not formatted.get("cards") or len(formatted.get("cards", [])) == 0:
+    cards = formatted.get("cards") or []
+    if not cards:
         return {
             "session_id": session_id,
             "questions": [],
@@ -203,17 +317,22 @@ def suggestions(session_id: str):
     # 画像不为空，用 LLM 生成个性化问题
     from utils.llm import get_llm
     from langchain_core.prompts import ChatPromptTemplate
-    from pydantic import BaseModel
-    import json
-
-    # 构建画像摘要
-    profile_parts = []
-    for card in formatted.get("cards", []):
-        items_text = [item["text"] for item in card.get("items", [])[:3]]
-        if items_text:
-            profile_parts.append(f"{card['title']}: {', '.join(items_text)}")
+    # 构建画像摘要（每张卡片取前 3 条）
+    profile_summary = "\n".join(
+        f"{card['title']}: {', '.join(item['text'] for item in card['items'][:3])}"
+        for card in cards
+        if card.get("items")
+    )
 
-    profile_summary = "\n".join(profile_parts)
+    # 画像没变就直接复用上次生成的问题（key = 画像摘要指纹），不再调用 LLM
+    fingerprint = hashlib.blake2b(profile_summary.encode("utf-8"), digest_size=16).digest()
+    cached = _suggestions_cache.get(fingerprint)
+    if cached is not None:
+        return {
+            "session_id": session_id,
+            "questions": list(cached),
+            "title": "💡 根据你的偏好，试试这些问法："
+        }
 
     prompt = ChatPromptTemplate.from_messages([
         ("system", """你是 IntelliGo 智能出行助手。根据用户的偏好画像，生成 3 个个性化的问题建议。
@@ -230,31 +349,27 @@ def suggestions(session_id: str):
 
 ## 示例
 用户偏好：喜欢安静、博物馆、预算敏感
-输出：["周末想找个安静的地方逛逛，有推荐吗？", "去博物馆一天怎么安排最省心？", "明天降温了，帮我搭一套休闲穿搭"]"""),
-        ("human", """用户偏好画像：
-{profile}
+输出：["周末想找个安静的地方逛逛，有推荐吗？", "去博物馆一天怎么安排最省心？", "明天降温了，帮我搭一套休闲穿搭"]
 
-请生成 3 个个性化问题建议：""")
+## 输入
+用户消息即用户偏好画像（每行“类别: 偏好1, 偏好2”），收到后请生成 3 个个性化问题建议。"""),
+        # human 只放画像本身，不变的说明都在 system（prompt 缓存前缀最长）
+        ("human", "{profile}")
     ])
 
     try:
         llm = get_llm(temperature=0.8)
         chain = prompt | llm
-        response = chain.invoke({"profile": profile_summary})
+        response = await chain.ainvoke({"profile": profile_summary})
 
         # 解析 JSON
         content = response.content if hasattr(response, "content") else str(response)
-        # 清理可能的 markdown 代码块
-        content = content.strip()
-        if content.startswith("```"):
-            content = content.split("\n", 1)[1] if "\n" in content else content[3:]
-        if content.endswith("```"):
-            content = content.rsplit("```", 1)[0]
-        content = content.strip()
-
-        questions = json.loads(content)
+        # 可能包在 markdown 代码块里：一次正则扫描取出 JSON 数组
+        m = _FENCE_RE.search(content)
+        questions = orjson.loads(m.group(1) if m else content.strip())
 
         if isinstance(questions, list) and len(questions) >= 3:
+            _suggestions_cache.set(fingerprint, tuple(questions[:3]))
             return {
                 "session_id": session_id,
                 "questions": questions[:3],
@@ -271,9 +386,45 @@ def suggestions(session_id: str):
     }
 
 
+# 文件名带内容指纹（如 app.3f9a1c2b.js）：内容变则文件名变，可让浏览器永久缓存
+_HASHED_ASSET_RE = re.compile(r"\.[0-9a-f]{8,}\.\w+$")
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    带缓存头的静态文件：
+    - 指纹文件名：public, max-age=1 年, immutable（不再回源）
+    - 其它文件：no-cache，每次用 ETag / Last-Modified 协商，未变化时直接 304
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if _HASHED_ASSET_RE.search(os.fspath(full_path)):
+            response.headers["cache-control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["cache-control"] = "no-cache"
+        return response
+
+
 # 可选：挂载静态目录（如果你后面要加 css/js 文件）
 # 当前 index.html 内联了，不依赖这个也能跑
 static_dir = os.path.join(os.path.dirname(__file__), "web", "static")
 if os.path.isdir(static_dir):
-    app.mount("/static", StaticFiles(directory=static_dir), name="static")
+    app.mount("/static", CachedStaticFiles(directory=static_dir), name="static")
 
+
+if __name__ == "__main__":
+    import importlib.util
+
+    import uvicorn
+
+    # C 实现的事件循环 / HTTP 解析器（uvicorn[standard]）；缺失时（如 Windows 无 uvloop）退回纯 Python 实现
+    uvicorn.run(
+        "server:app",
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "8000")),
+        loop="uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        http="httptools" if importlib.util.find_spec("httptools") else "h11",
+        # 会话默认存在进程内存里：多 worker 需设置 REDIS_URL 共享会话，默认单进程
+        workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+    )
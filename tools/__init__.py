@@ -1,8 +1,9 @@
 """
 工具集 - 外部 API 封装
+
+导出按需加载：只 import tools.weather 时不必连带初始化穿搭 LLM
 """
-from tools.weather import weather_tool, AMapWeatherTool
-from tools.clothing import clothing_advisor, ClothingAdvisor
+from utils.lazy import lazy_getattr
 
 __all__ = [
     "weather_tool",
@@ -10,3 +11,10 @@ __all__ = [
     "clothing_advisor",
     "ClothingAdvisor",
 ]
+
+__getattr__ = lazy_getattr(__name__, {
+    "weather_tool": "tools.weather",
+    "AMapWeatherTool": "tools.weather",
+    "clothing_advisor": "tools.clothing",
+    "ClothingAdvisor": "tools.clothing",
+})
@@ -2,14 +2,16 @@
 穿搭建议生成器
 结合天气数据给出科学的穿衣建议（支持“配套穿搭/套装化输出”）
 """
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from langchain_core.prompts import ChatPromptTemplate
 from utils.llm import get_structured_llm
 from graph.state import WeatherInfo
 
 
 class ClothingAdvice(BaseModel):
-    """穿搭建议结构（方案 B：套装化）"""
+    """穿搭建议结构（方案 B：套装化；只读）"""
+    model_config = ConfigDict(frozen=True)
+
     summary: str = Field(description="一句话总结（要体现活动/场景与温度）")
 
     # 配套穿搭关键字段
@@ -58,18 +60,14 @@ CLOTHING_PROMPT = ChatPromptTemplate.from_messages([
 3. tips 至少包含 2 条，且要与当天活动相关（例如：爬山出汗、久走磨脚、寺庙需端庄、夜间降温、雨天防滑）。
 4. shoes 必须结合“步行/上下坡/雨天防滑/正式度”给理由。
 
-请给出具体、可执行的建议，避免泛泛而谈。"""),
-    ("human", """## 天气信息
-- 城市：{city}
-- 天气：{weather}
-- 温度：{temperature}°C
-- 湿度：{humidity}%
-- 风力：{wind_power}
-
-## 用户补充（包含活动/场景/偏好/原话/记忆）
-{user_context}
+请给出具体、可执行的建议，避免泛泛而谈。
 
-请给出今日穿搭建议："""),
+## 输入格式
+用户消息第一行是今日天气信息，按“|”分隔依次为：城市|天气|温度(°C)|湿度(%)|风力
+第二行起是用户补充（包含活动/场景/偏好/原话/记忆）
+收到后请给出今日穿搭建议。"""),
+    # 不变的说明全部放在 system，human 只放变量：共享前缀最长，便于命中 API 侧的 prompt 缓存
+    ("human", "{city}|{weather}|{temperature}|{humidity}|{wind_power}\n{user_context}"),
 ])
 
 
@@ -80,16 +78,24 @@ class ClothingAdvisor:
         # 结构化输出：ClothingAdvice
         self.chain = CLOTHING_PROMPT | get_structured_llm(ClothingAdvice, temperature=0.3)
 
-    def advise(self, weather: WeatherInfo, user_context: str = "") -> ClothingAdvice:
-        """生成穿搭建议"""
-        return self.chain.invoke({
+    @staticmethod
+    def _inputs(weather: WeatherInfo, user_context: str) -> dict:
+        return {
             "city": weather.city,
             "weather": weather.weather,
             "temperature": weather.temperature,
             "humidity": weather.humidity,
             "wind_power": weather.wind_power or "微风",
             "user_context": user_context or "日常出行",
-        })
+        }
+
+    def advise(self, weather: WeatherInfo, user_context: str = "") -> ClothingAdvice:
+        """生成穿搭建议"""
+        return self.chain.invoke(self._inputs(weather, user_context))
+
+    async def aadvise(self, weather: WeatherInfo, user_context: str = "") -> ClothingAdvice:
+        """advise 的异步版本（多日建议可并发生成）"""
+        return await self.chain.ainvoke(self._inputs(weather, user_context))
 
     def format_advice(self, advice: ClothingAdvice) -> str:
         """格式化输出"""
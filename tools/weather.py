@@ -2,6 +2,8 @@
 高德天气 API 封装
 文档: https://lbs.amap.com/api/webservice/guide/api/weatherinfo
 """
+import asyncio
+import importlib.util
 import httpx
 from typing import Literal
 from pydantic import BaseModel
@@ -16,6 +18,13 @@ CITY_CODES = {
     "天津": "120000", "青岛": "370200", "厦门": "350200", "三亚": "460200",
 }
 
+# 连接池：长连接复用（省掉重复的 TCP + TLS 握手）；装了 h2 时走 HTTP/2，并发查询复用同一条连接
+_HTTP2 = importlib.util.find_spec("h2") is not None
+_LIMITS = httpx.Limits(max_keepalive_connections=20, max_connections=100)
+
+# 查询用：同时收录“北京”和“北京市”两种写法，查编码只需一次字典查找
+_CITY_CODE_LOOKUP = {**CITY_CODES, **{name + "市": code for name, code in CITY_CODES.items()}}
+
 
 class AMapWeatherTool:
     """高德天气查询工具"""
@@ -24,11 +33,43 @@ class AMapWeatherTool:
 
     def __init__(self):
         self.api_key = config.amap_api_key
-        self.client = httpx.Client(timeout=10.0)
+        self.client = httpx.Client(timeout=10.0, http2=_HTTP2, limits=_LIMITS)
+        # 异步客户端：复用连接池（TLS 握手摊销）；连接池绑定事件循环，每个循环一个，懒加载
+        self._aclients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None:
+            # 顺手丢掉已关闭循环上的客户端（循环关了无法再 aclose，连接随对象回收）
+            for old in [l for l in self._aclients if l.is_closed()]:
+                del self._aclients[old]
+            client = self._aclients[loop] = httpx.AsyncClient(timeout=10.0, http2=_HTTP2, limits=_LIMITS)
+        return client
+
+    async def aclose(self) -> None:
+        """
+        关闭全部异步客户端（服务退出时调用）
+        当前循环上的直接 await；其它仍在运行的循环（如 utils.aio 的常驻循环）投递到该循环上关闭
+        """
+        current = asyncio.get_running_loop()
+        clients, self._aclients = self._aclients, {}
+        for loop, client in clients.items():
+            if loop is current:
+                await client.aclose()
+            elif loop.is_running() and not loop.is_closed():
+                asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    def _params(self, city_code: str, extensions: str) -> dict:
+        return {
+            "key": self.api_key,
+            "city": city_code,
+            "extensions": extensions,
+            "output": "JSON"
+        }
 
     def _get_city_code(self, city: str) -> str | None:
-        city_clean = city.rstrip("市")
-        return CITY_CODES.get(city_clean)
+        return _CITY_CODE_LOOKUP.get(city)
 
     def _generate_suggestion(self, d: dict) -> str:
         weather = d.get("weather") or d.get("dayweather") or d.get("nightweather") or ""
@@ -90,26 +131,7 @@ class AMapWeatherTool:
             )
         return out
 
-    def get_weather(self, city: str, extensions: Literal["base", "all"] = "base") -> WeatherInfo:
-        """
-        获取天气信息
-        extensions: "base"=实时天气, "all"=预报天气（若要多日请用 get_forecast）
-        """
-        if not self.api_key:
-            return self._mock_weather(city)
-
-        city_code = self._get_city_code(city)
-        if not city_code:
-            return WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")
-
-        resp = self.client.get(self.BASE_URL, params={
-            "key": self.api_key,
-            "city": city_code,
-            "extensions": extensions,
-            "output": "JSON"
-        })
-        data = resp.json()
-
+    def _parse_weather(self, data: dict, city: str, extensions: str) -> WeatherInfo:
         if data.get("status") != "1":
             return WeatherInfo(city=city, weather="查询失败", suggestion=data.get("info", ""), raw_data=data)
 
@@ -144,25 +166,7 @@ class AMapWeatherTool:
         except Exception as e:
             return WeatherInfo(city=city, weather="解析失败", suggestion=f"预报解析失败: {e}", raw_data=data)
 
-    def get_forecast(self, city: str, days: int = 3) -> list[WeatherInfo]:
-        """获取未来 N 天预报（按天返回 WeatherInfo 列表）"""
-        days = max(1, int(days or 1))
-
-        if not self.api_key:
-            return self._mock_forecast(city, days)
-
-        city_code = self._get_city_code(city)
-        if not city_code:
-            return [WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")]
-
-        resp = self.client.get(self.BASE_URL, params={
-            "key": self.api_key,
-            "city": city_code,
-            "extensions": "all",
-            "output": "JSON"
-        })
-        data = resp.json()
-
+    def _parse_forecast(self, data: dict, city: str, days: int) -> list[WeatherInfo]:
         if data.get("status") != "1":
             return [WeatherInfo(city=city, weather="查询失败", suggestion=data.get("info", ""), raw_data=data)]
 
@@ -197,6 +201,61 @@ class AMapWeatherTool:
 
         return out
 
+    def get_weather(self, city: str, extensions: Literal["base", "all"] = "base") -> WeatherInfo:
+        """
+        获取天气信息
+        extensions: "base"=实时天气, "all"=预报天气（若要多日请用 get_forecast）
+        """
+        if not self.api_key:
+            return self._mock_weather(city)
+
+        city_code = self._get_city_code(city)
+        if not city_code:
+            return WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")
+
+        resp = self.client.get(self.BASE_URL, params=self._params(city_code, extensions))
+        return self._parse_weather(resp.json(), city, extensions)
+
+    async def get_weather_async(self, city: str, extensions: Literal["base", "all"] = "base") -> WeatherInfo:
+        """get_weather 的异步版本（多城市可并发查询）"""
+        if not self.api_key:
+            return self._mock_weather(city)
+
+        city_code = self._get_city_code(city)
+        if not city_code:
+            return WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")
+
+        resp = await self._get_aclient().get(self.BASE_URL, params=self._params(city_code, extensions))
+        return self._parse_weather(resp.json(), city, extensions)
+
+    def get_forecast(self, city: str, days: int = 3) -> list[WeatherInfo]:
+        """获取未来 N 天预报（按天返回 WeatherInfo 列表）"""
+        days = max(1, int(days or 1))
+
+        if not self.api_key:
+            return self._mock_forecast(city, days)
+
+        city_code = self._get_city_code(city)
+        if not city_code:
+            return [WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")]
+
+        resp = self.client.get(self.BASE_URL, params=self._params(city_code, "all"))
+        return self._parse_forecast(resp.json(), city, days)
+
+    async def get_forecast_async(self, city: str, days: int = 3) -> list[WeatherInfo]:
+        """get_forecast 的异步版本（多城市可并发查询）"""
+        days = max(1, int(days or 1))
+
+        if not self.api_key:
+            return self._mock_forecast(city, days)
+
+        city_code = self._get_city_code(city)
+        if not city_code:
+            return [WeatherInfo(city=city, weather="未知", suggestion=f"暂不支持查询 {city} 的天气，请检查城市名称")]
+
+        resp = await self._get_aclient().get(self.BASE_URL, params=self._params(city_code, "all"))
+        return self._parse_forecast(resp.json(), city, days)
+
 # 工具单例
 weather_tool = AMapWeatherTool()
 
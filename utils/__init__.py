@@ -1,6 +1,13 @@
 """
 工具模块
+
+导出按需加载：utils.aio / utils.cache 等轻量模块不必连带加载 langchain_openai
 """
-from utils.llm import get_llm, get_structured_llm
+from utils.lazy import lazy_getattr
 
 __all__ = ["get_llm", "get_structured_llm"]
+
+__getattr__ = lazy_getattr(__name__, {
+    "get_llm": "utils.llm",
+    "get_structured_llm": "utils.llm",
+})
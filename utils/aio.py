@@ -0,0 +1,31 @@
+"""
+异步执行辅助
+图中的节点已是 async（并发调用 LLM / HTTP），同步入口（CLI、同步接口）通过这里驱动
+"""
+import asyncio
+import threading
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+_LOOP: asyncio.AbstractEventLoop | None = None
+_LOCK = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    """
+    常驻后台事件循环（单例）
+    不用每次 asyncio.run：LLM/httpx 的异步客户端会把连接池绑定到首次使用的循环上，
+    循环关闭后再复用会报 "Event loop is closed"
+    """
+    global _LOOP
+    with _LOCK:
+        if _LOOP is None:
+            _LOOP = asyncio.new_event_loop()
+            threading.Thread(target=_LOOP.run_forever, name="intelligo-aio", daemon=True).start()
+    return _LOOP
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """在常驻事件循环上执行协程并阻塞等待结果（线程安全）"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
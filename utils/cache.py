@@ -0,0 +1,178 @@
+"""
+进程内缓存
+- LRUCache: 线程安全的 LRU（可选 TTL）
+- HashedLLMCache: LangChain LLM 响应缓存，key = blake2b(渲染后的 prompt + llm_string)
+- SemanticCache: 语义缓存，按 embedding 余弦相似度命中近似重复的输入
+- CachedEmbeddings: Embeddings 包装器，按文本 sha256 缓存向量
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+import numpy as np
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.embeddings import Embeddings
+
+
+class LRUCache:
+    """线程安全的 LRU 缓存（ttl_seconds=None 表示不过期）"""
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float | None = None):
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._maxsize = maxsize
+        self._ttl = ttl_seconds
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            ts, value = item
+            if self._ttl is not None and time.monotonic() - ts > self._ttl:
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class HashedLLMCache(BaseCache):
+    """
+    LLM 响应缓存
+    prompt 是 LangChain 序列化后的完整消息；llm_string 已包含 model/temperature/结构化输出 schema，
+    二者拼接后做 blake2b 摘要作为 key，避免长 prompt 常驻内存
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self._lru = LRUCache(maxsize=maxsize)
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> bytes:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(prompt.encode("utf-8"))
+        h.update(b"\x00")
+        h.update(llm_string.encode("utf-8"))
+        return h.digest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self._lru.get(self._key(prompt, llm_string))
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self._lru.set(self._key(prompt, llm_string), return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        self._lru.clear()
+
+    # 纯内存操作，无需像默认实现那样切到线程池
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear()
+
+
+class SemanticCache:
+    """
+    语义缓存（线程安全，LRU 淘汰）
+    - 向量需已归一化：点积即余弦相似度，一次矩阵乘法算出与全部条目的相似度
+    - namespace: 只在同一命名空间内匹配（如按日期隔离，"明天"在不同日期含义不同）
+    - guard: 必须完全相等才可命中（如输入中的数字/城市），防止"玩2天"命中"玩3天"
+    """
+
+    def __init__(self, maxsize: int = 1000, threshold: float = 0.92):
+        self._maxsize = maxsize
+        self._threshold = threshold
+        self._lock = threading.Lock()
+        self._vecs: np.ndarray | None = None  # (maxsize, dim)，按槽位存放
+        self._meta: list[tuple[Hashable, Hashable, Any] | None] = [None] * maxsize  # (namespace, guard, value)
+        self._lru: "OrderedDict[int, None]" = OrderedDict()  # 已占用槽位，队头最久未用
+
+    def get(self, vec, namespace: Hashable = None, guard: Hashable = None) -> Any:
+        with self._lock:
+            if self._vecs is None or not self._lru:
+                return None
+            sims = self._vecs @ np.asarray(vec, dtype=np.float32)
+            for slot in np.argsort(sims)[::-1]:
+                if sims[slot] < self._threshold:
+                    break
+                meta = self._meta[slot]
+                if meta is not None and meta[0] == namespace and meta[1] == guard:
+                    self._lru.move_to_end(int(slot))
+                    return meta[2]
+            return None
+
+    def set(self, vec, value: Any, namespace: Hashable = None, guard: Hashable = None) -> None:
+        v = np.asarray(vec, dtype=np.float32)
+        with self._lock:
+            if self._vecs is None:
+                self._vecs = np.zeros((self._maxsize, v.shape[0]), dtype=np.float32)
+            if len(self._lru) < self._maxsize:
+                slot = len(self._lru)
+            else:
+                slot, _ = self._lru.popitem(last=False)
+            self._vecs[slot] = v
+            self._meta[slot] = (namespace, guard, value)
+            self._lru[slot] = None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vecs = None
+            self._meta = [None] * self._maxsize
+            self._lru.clear()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding 缓存（进程内 LRU）
+    key = sha256(文本)；同一模型对同一文本的向量是确定的，不设过期
+    embed_documents 只对未命中的文本做一次批量计算
+    """
+
+    def __init__(self, inner: Embeddings, maxsize: int = 4096):
+        self.inner = inner
+        self._lru = LRUCache(maxsize=maxsize)
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.sha256(text.encode("utf-8")).digest()
+
+    def embed_query(self, text: str) -> list[float]:
+        key = self._key(text)
+        vec = self._lru.get(key)
+        if vec is None:
+            vec = self.inner.embed_query(text)
+            self._lru.set(key, vec)
+        return vec
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        keys = [self._key(t) for t in texts]
+        out = [self._lru.get(k) for k in keys]
+        miss = [i for i, v in enumerate(out) if v is None]
+        if miss:
+            vecs = self.inner.embed_documents([texts[i] for i in miss])
+            for i, v in zip(miss, vecs):
+                out[i] = v
+                self._lru.set(keys[i], v)
+        return out
@@ -0,0 +1,20 @@
+"""
+日期辅助（纯标准库，供节点/agent 共用，不引入 LLM 依赖）
+"""
+import time
+from datetime import date
+
+# 当天日期缓存：(刷新时刻, "YYYY-MM-DD")，60 秒内复用，避免每轮都取系统时间并格式化
+_TODAY_TTL = 60.0
+_today_cache: tuple[float, str] = (0.0, "")
+
+
+def today_str() -> str:
+    """当前日期 YYYY-MM-DD（最多 60 秒刷新一次）"""
+    global _today_cache
+    ts, value = _today_cache
+    now = time.monotonic()
+    if not value or now - ts > _TODAY_TTL:
+        value = date.today().isoformat()
+        _today_cache = (now, value)
+    return value
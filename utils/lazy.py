@@ -0,0 +1,20 @@
+"""
+包级导出按需加载（PEP 562）
+各包 __init__ 里 `__getattr__ = lazy_getattr(__name__, {导出名: 子模块})`，首次访问时才导入子模块
+"""
+import importlib
+import sys
+from typing import Any, Callable, Mapping
+
+
+def lazy_getattr(mod_name: str, exports: Mapping[str, str]) -> Callable[[str], Any]:
+    """生成模块级 __getattr__：按 exports 导入子模块取出属性，并缓存到包模块上（之后不再走 __getattr__）"""
+    def __getattr__(name: str) -> Any:
+        module = exports.get(name)
+        if module is None:
+            raise AttributeError(f"module {mod_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module), name)
+        setattr(sys.modules[mod_name], name, value)
+        return value
+
+    return __getattr__
@@ -2,14 +2,32 @@
 LLM 客户端统一封装
 支持第三方 OpenAI 兼容 API
 """
+from functools import lru_cache
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from config import config
 from langchain_huggingface import HuggingFaceEmbeddings
+from utils.cache import CachedEmbeddings, HashedLLMCache, SemanticCache
 
-def get_llm(temperature: float = 0.7, model: str | None = None,max_retries: int = 3,) -> ChatOpenAI:
+# 确定性调用（temperature=0）的响应缓存：相同 prompt + 模型参数直接命中，省掉一次 API 往返
+llm_cache = HashedLLMCache(maxsize=1024)
+
+# 语义缓存：近似重复的用户输入复用 rewrite/router 结果（config.semantic_cache 开启时使用）
+semantic_cache = SemanticCache(maxsize=1000, threshold=0.92)
+
+
+def clear_llm_cache() -> None:
+    """清空 LLM 响应缓存（含语义缓存）"""
+    llm_cache.clear()
+    semantic_cache.clear()
+
+
+@lru_cache(maxsize=16)
+def get_llm(temperature: float = 0.7, model: str | None = None,max_retries: int = 3, cache: bool = False) -> ChatOpenAI:
     """
     获取 LLM 实例
     自动使用配置中的 base_url，支持第三方 API 代理
+    cache=True 时挂载响应缓存（仅适合确定性输出）
+    按参数缓存：相同配置共享同一个客户端（及其底层 HTTP 连接池），调用方不要修改返回的实例
     """
     return ChatOpenAI(
         api_key=config.openai_api_key,
@@ -18,27 +36,44 @@ def get_llm(temperature: float = 0.7, model: str | None = None,max_retries: int
         max_retries=max_retries,
         request_timeout=60,
         temperature=temperature,
+        cache=llm_cache if cache else None,
     )
 
 
-def get_structured_llm(output_schema, temperature: float = 0.0):
-    """获取结构化输出的 LLM"""
-    llm = get_llm(temperature=temperature)
+@lru_cache(maxsize=None)
+def get_structured_llm(output_schema, temperature: float = 0.0, deterministic: bool | None = None):
+    """
+    获取结构化输出的 LLM
+    deterministic: 是否启用响应缓存；默认仅 temperature=0 时启用
+    按 (schema, temperature, deterministic) 缓存：with_structured_output 需要生成 JSON Schema 并绑定，
+    相同配置共享同一个 runnable
+    """
+    if deterministic is None:
+        deterministic = temperature == 0.0
+    llm = get_llm(temperature=temperature, cache=deterministic)
     return llm.with_structured_output(output_schema)
 
 
-def get_embeddings() -> HuggingFaceEmbeddings:
+@lru_cache(maxsize=1)
+def get_embeddings() -> CachedEmbeddings:
     """
-    获取 Embedding 模型
+    获取 Embedding 模型（单例：模型加载很重，全进程共享一份）
+    外面套一层按文本缓存的 CachedEmbeddings：重复的查询/偏好文本不再重新编码
 
     注意：某些第三方 API 可能不支持 embedding，需要单独配置
     """
-    return HuggingFaceEmbeddings(
+    # 有 CUDA 时放到 GPU 并加大批量（显存足够，批量越大单条越便宜）；否则 CPU + 中等批量
+    try:
+        import torch
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        device = "cpu"
+    return CachedEmbeddings(HuggingFaceEmbeddings(
     model_name="Qwen/Qwen3-Embedding-0.6B",
     model_kwargs={
-        "device": 'cpu',},
+        "device": device,},
     encode_kwargs={
         'normalize_embeddings': True,  # 可选：归一化向量，有助于相似度计算
-        "batch_size": 32
+        "batch_size": 256 if device == "cuda" else 64
     }
-)
+))